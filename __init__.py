@@ -1,13 +1,16 @@
-from .save_upload_s3 import SaveAndUploadToS3
+from .save_upload_s3 import SaveAndUploadToS3, resume_pending_uploads
 from .save_and_upload_to_gdrive import *
-from .sdxl_image_sizes import SdxlImageSizes
+from .save_and_upload_multi import SaveAndUploadToSinks
+from .sdxl_image_sizes import SdxlBucketResize, SdxlImageSizes
 from .openai_nodes import *
 
 
 NODE_CLASS_MAPPINGS = {
     "CESILK_SaveAndUploadToS3": SaveAndUploadToS3,
     "CESILK_SaveAndUploadToGoogleDrive": SaveAndUploadToGoogleDrive,
+    "CESILK_SaveAndUploadToSinks": SaveAndUploadToSinks,
     "CESILK_SdxlImageSizes": SdxlImageSizes,
+    "CESILK_SdxlBucketResize": SdxlBucketResize,
 
     "CESILK_OpenAIImageBatchGenerator": OpenAIImageBatchGenerator,
     "CESILK_OpenAIImageDescriptionToTextfile": OpenAIImageDescriptionToTextfile,
@@ -17,7 +20,9 @@ NODE_CLASS_MAPPINGS = {
 NODE_DISPLAY_NAME_MAPPINGS = {
     "CESILK_SaveAndUploadToS3": "CESILK Save and Upload to S3",
     "CESILK_SaveAndUploadToGoogleDrive": "CESILK Save And Upload To Google Drive",
+    "CESILK_SaveAndUploadToSinks": "CESILK Save And Upload (Local / S3 / Google Drive)",
     "CESILK_SdxlImageSizes": "CESILK SDXL Image Sizes",
+    "CESILK_SdxlBucketResize": "CESILK SDXL Bucket Resize",
 
     "CESILK_OpenAIImageBatchGenerator": "CESILK OpenAI Image Generator (Batch)",
     "CESILK_OpenAIImageDescriptionToTextfile": "CESILK OpenAI Image Description to Textfile",
@@ -25,3 +30,5 @@ NODE_DISPLAY_NAME_MAPPINGS = {
 }
 
 __all__ = ["NODE_CLASS_MAPPINGS", "NODE_DISPLAY_NAME_MAPPINGS"]
+
+resume_pending_uploads()
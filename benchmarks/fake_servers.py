@@ -0,0 +1,509 @@
+"""
+Local stand-ins for the OpenAI, S3 and Google Drive HTTP APIs, used by the
+benchmarks. They implement just enough of each API for the nodes in this
+package, keep everything in memory and can add latency and rate limits.
+"""
+import base64
+import collections
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Server:
+    handler = None
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._lock = threading.Lock()
+        handler = type("Handler", (self.handler,), {"server_state": self})
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def delay(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.random() * self.jitter)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send(self, status, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode("utf-8")
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+# --- OpenAI -----------------------------------------------------------------
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        state = self.server_state
+        body = self.read_body()
+        state.delay()
+
+        throttled = state.check_rate_limit()
+        if throttled is not None:
+            return self.send(429, {"error": {
+                "message": "Rate limit reached (fake server)", "type": "requests", "code": "rate_limit_exceeded",
+            }}, headers=throttled)
+        headers = state.rate_limit_headers()
+
+        path = urlparse(self.path).path
+        if path.endswith("/chat/completions"):
+            request = json.loads(body)
+            if request.get("stream"):
+                return self.stream_chat(request, headers)
+            return self.send(200, state.chat_completion(request), headers=headers)
+        if path.endswith("/images/generations"):
+            return self.send(200, state.image_generation(json.loads(body)), headers=headers)
+        if path.endswith("/files"):
+            return self.send(200, state.upload_file(self.headers.get("Content-Type"), body), headers=headers)
+        if path.endswith("/batches"):
+            return self.send(200, state.create_batch(json.loads(body)), headers=headers)
+        self.send(404, {"error": {"message": f"unknown path {path}"}})
+
+    def do_GET(self):
+        state = self.server_state
+        state.delay()
+        path = urlparse(self.path).path
+        match = re.search(r"/batches/([^/]+)$", path)
+        if match:
+            return self.send(200, state.batches[match.group(1)])
+        match = re.search(r"/files/([^/]+)/content$", path)
+        if match:
+            return self.send(200, state.files[match.group(1)], content_type="application/octet-stream")
+        self.send(404, {"error": {"message": f"unknown path {path}"}})
+
+    def stream_chat(self, request, headers):
+        state = self.server_state
+        text = state.reply_text(request)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if state.token_interval:
+                time.sleep(state.token_interval)
+            event(json.dumps(state.chunk(request, (" " if i else "") + word)))
+        usage_chunk = state.chunk(request, None)
+        usage_chunk["choices"] = []
+        usage_chunk["usage"] = {"prompt_tokens": 10, "completion_tokens": len(words), "total_tokens": 10 + len(words)}
+        event(json.dumps(usage_chunk))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(_Server):
+    """
+    Fake OpenAI API: chat completions (incl. streaming and packed JSON
+    replies), image generation, files and the Batch API.
+
+    ``requests_per_minute`` > 0 enables a sliding-window limit answered with
+    429s and x-ratelimit-* headers like the real API.
+    """
+
+    handler = _OpenAIHandler
+
+    def __init__(self, latency=0.0, jitter=0.0, requests_per_minute=0, token_interval=0.0, batch_delay=0.0):
+        super().__init__(latency, jitter)
+        self.requests_per_minute = requests_per_minute
+        self.token_interval = token_interval
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.batches = {}
+        self._window = collections.deque()
+        self._images = {}
+
+    def check_rate_limit(self):
+        if not self.requests_per_minute:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            if len(self._window) >= self.requests_per_minute:
+                reset = 60 - (now - self._window[0])
+                return {
+                    "retry-after-ms": str(int(reset * 1000)),
+                    "x-ratelimit-limit-requests": str(self.requests_per_minute),
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": f"{reset:.3f}s",
+                }
+            self._window.append(now)
+        return None
+
+    def rate_limit_headers(self):
+        if not self.requests_per_minute:
+            return {}
+        with self._lock:
+            remaining = self.requests_per_minute - len(self._window)
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(max(0, remaining)),
+            "x-ratelimit-limit-tokens": "1000000",
+            "x-ratelimit-remaining-tokens": "1000000",
+        }
+
+    def reply_text(self, request):
+        images = [
+            part for message in request.get("messages", [])
+            if isinstance(message.get("content"), list)
+            for part in message["content"] if part.get("type") == "image_url"
+        ]
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({"descriptions": [f"A synthetic description of image {i}." for i in range(len(images))]})
+        return "This is a synthetic reply from the fake OpenAI server used for benchmarking."
+
+    def chat_completion(self, request):
+        text = self.reply_text(request)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(text.split()), "total_tokens": 10 + len(text.split())},
+        }
+
+    def chunk(self, request, delta):
+        return {
+            "id": "chatcmpl-stream",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model"),
+            "choices": [{"index": 0, "delta": {"content": delta} if delta is not None else {}, "finish_reason": None}],
+        }
+
+    def image_generation(self, request):
+        width, height = (int(v) for v in request.get("size", "1024x1024").split("x"))
+        return {
+            "created": int(time.time()),
+            "data": [{"b64_json": self._image_b64(width, height)} for _ in range(request.get("n", 1))],
+        }
+
+    def _image_b64(self, width, height):
+        # One PNG per size, generated once, so the server does not dominate CPU time
+        with self._lock:
+            cached = self._images.get((width, height))
+        if cached is None:
+            import numpy as np
+            from PIL import Image
+
+            pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+            cached = base64.b64encode(buffer.getvalue()).decode("ascii")
+            with self._lock:
+                self._images[(width, height)] = cached
+        return cached
+
+    def upload_file(self, content_type, body):
+        # multipart/form-data with a single "file" part
+        boundary = re.search(r"boundary=([^;]+)", content_type).group(1).strip('"').encode("ascii")
+        for part in body.split(b"--" + boundary):
+            if b'name="file"' in part:
+                content = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]
+                break
+        else:
+            content = b""
+        file_id = f"file-{uuid.uuid4().hex}"
+        self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed"}
+
+    def create_batch(self, request):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        lines = [json.loads(line) for line in self.files[request["input_file_id"]].decode("utf-8").splitlines() if line.strip()]
+        output = "\n".join(json.dumps({
+            "id": f"response-{i}",
+            "custom_id": line["custom_id"],
+            "response": {"status_code": 200, "body": self.chat_completion(line["body"])},
+            "error": None,
+        }) for i, line in enumerate(lines))
+        output_file_id = f"file-{uuid.uuid4().hex}"
+        self.files[output_file_id] = output.encode("utf-8")
+
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": request["endpoint"], "input_file_id": request["input_file_id"],
+            "completion_window": request["completion_window"], "status": "in_progress", "created_at": int(time.time()),
+            "output_file_id": None, "error_file_id": None,
+        }
+        self.batches[batch_id] = batch
+
+        def complete():
+            batch.update(status="completed", output_file_id=output_file_id)
+
+        threading.Timer(self.batch_delay, complete).start()
+        return dict(batch)
+
+
+# --- S3 ---------------------------------------------------------------------
+
+class _S3Handler(_Handler):
+    def do_PUT(self):
+        state = self.server_state
+        body = self.read_body()
+        state.delay()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if "uploadId" in query:
+            etag = state.put_part(query["uploadId"][0], int(query["partNumber"][0]), body)
+        elif "x-amz-copy-source" in self.headers:
+            etag = state.copy_object(self.headers["x-amz-copy-source"], url.path)
+            return self.send(200, f"<CopyObjectResult><ETag>{etag}</ETag></CopyObjectResult>", "application/xml")
+        else:
+            etag = state.put_object(url.path, body)
+        self.send(200, headers={"ETag": etag})
+
+    def do_POST(self):
+        state = self.server_state
+        self.read_body()
+        state.delay()
+        url = urlparse(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        bucket, key = url.path.lstrip("/").split("/", 1)
+        if "uploads" in query:
+            upload_id = state.create_multipart(url.path)
+            return self.send(200, (
+                "<InitiateMultipartUploadResult>"
+                f"<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>"
+            ), "application/xml")
+        if "uploadId" in query:
+            etag = state.complete_multipart(query["uploadId"][0])
+            return self.send(200, (
+                "<CompleteMultipartUploadResult>"
+                f"<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>{etag}</ETag>"
+                "</CompleteMultipartUploadResult>"
+            ), "application/xml")
+        self.send(400)
+
+    def do_HEAD(self):
+        obj = self.server_state.objects.get(urlparse(self.path).path)
+        if obj is None:
+            return self.send(404)
+        self.send(200, headers={"ETag": obj["etag"], "Content-Length": str(obj["size"])})
+
+    def do_GET(self):
+        state = self.server_state
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        bucket = url.path.strip("/")
+        if "/" not in bucket:
+            # ListObjectsV2 (single page)
+            prefix = query.get("prefix", [""])[0]
+            contents = "".join(
+                f"<Contents><Key>{path.split('/', 2)[2]}</Key><ETag>{obj['etag']}</ETag><Size>{obj['size']}</Size></Contents>"
+                for path, obj in sorted(state.objects.items())
+                if path.startswith(f"/{bucket}/{prefix}")
+            )
+            return self.send(200, (
+                "<ListBucketResult>"
+                f"<Name>{bucket}</Name><Prefix>{prefix}</Prefix><IsTruncated>false</IsTruncated>{contents}"
+                "</ListBucketResult>"
+            ), "application/xml")
+        self.send(404)
+
+
+class FakeS3Server(_Server):
+    """Fake S3 endpoint (path-style): PUT/HEAD/copy, multipart uploads and ListObjectsV2."""
+
+    handler = _S3Handler
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        super().__init__(latency, jitter)
+        self.objects = {}
+        self.bytes_received = 0
+        self._uploads = {}
+
+    def put_object(self, path, body):
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with self._lock:
+            self.objects[path] = {"etag": etag, "size": len(body)}
+            self.bytes_received += len(body)
+        return etag
+
+    def copy_object(self, source, path):
+        with self._lock:
+            obj = dict(self.objects["/" + source.lstrip("/")])
+            self.objects[path] = obj
+        return obj["etag"]
+
+    def create_multipart(self, path):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {"path": path, "parts": {}}
+        return upload_id
+
+    def put_part(self, upload_id, number, body):
+        with self._lock:
+            self._uploads[upload_id]["parts"][number] = len(body)
+            self.bytes_received += len(body)
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def complete_multipart(self, upload_id):
+        with self._lock:
+            upload = self._uploads.pop(upload_id)
+            etag = f'"{uuid.uuid4().hex}-{len(upload["parts"])}"'
+            self.objects[upload["path"]] = {"etag": etag, "size": sum(upload["parts"].values())}
+        return etag
+
+
+# --- Google Drive -------------------------------------------------------------
+
+class _DriveHandler(_Handler):
+    def do_GET(self):
+        state = self.server_state
+        state.delay()
+        url = urlparse(self.path)
+        if url.path.endswith("/drive/v3/files"):
+            q = parse_qs(url.query).get("q", [""])[0]
+            name = re.search(r"name = '([^']*)'", q)
+            parent = re.search(r"'([^']*)' in parents", q)
+            files = [
+                {"id": f["id"], "name": f["name"]} for f in state.list_files()
+                if f["mimeType"] == "application/vnd.google-apps.folder"
+                and (name is None or f["name"] == name.group(1))
+                and (parent is None or parent.group(1) in f["parents"])
+            ]
+            return self.send(200, {"files": files})
+        self.send(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_POST(self):
+        state = self.server_state
+        body = self.read_body()
+        state.delay()
+        url = urlparse(self.path)
+        if url.path.endswith("/upload/drive/v3/files"):
+            # start a resumable session
+            session_id = state.start_session(json.loads(body or b"{}"))
+            location = f"{state.url}/upload/drive/v3/files?uploadType=resumable&upload_id={session_id}"
+            return self.send(200, {}, headers={"Location": location})
+        if url.path.endswith("/drive/v3/files"):
+            return self.send(200, state.create_file(json.loads(body), 0))
+        self.send(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_PUT(self):
+        state = self.server_state
+        body = self.read_body()
+        state.delay()
+        session_id = parse_qs(urlparse(self.path).query).get("upload_id", [None])[0]
+        session = state.sessions.get(session_id)
+        if session is None:
+            return self.send(404, {"error": {"code": 404, "message": "upload session not found"}})
+
+        content_range = self.headers.get("Content-Range", "")
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", content_range)
+        if match:
+            session["received"] = int(match.group(2)) + 1
+            state.add_bytes(len(body))
+            total = match.group(3)
+        else:
+            # status query: "bytes */total"
+            total = content_range.rsplit("/", 1)[-1]
+
+        if total != "*" and session["received"] >= int(total):
+            del state.sessions[session_id]
+            return self.send(200, state.create_file(session["metadata"], session["received"]))
+        headers = {"Range": f"bytes=0-{session['received'] - 1}"} if session["received"] else {}
+        self.send(308, b"", headers=headers)
+
+
+class FakeDriveServer(_Server):
+    """Fake Drive v3 endpoint: folder list/create and resumable media uploads."""
+
+    handler = _DriveHandler
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        super().__init__(latency, jitter)
+        self.files = []
+        self.sessions = {}
+        self.bytes_received = 0
+
+    def list_files(self):
+        with self._lock:
+            return list(self.files)
+
+    def create_file(self, metadata, size):
+        file = {
+            "id": uuid.uuid4().hex,
+            "name": metadata.get("name"),
+            "mimeType": metadata.get("mimeType", "application/octet-stream"),
+            "parents": metadata.get("parents", []),
+            "size": size,
+        }
+        with self._lock:
+            self.files.append(file)
+        return {"id": file["id"]}
+
+    def start_session(self, metadata):
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = {"metadata": metadata, "received": 0}
+        return session_id
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes_received += count
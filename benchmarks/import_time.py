@@ -0,0 +1,110 @@
+"""
+Import-time budget check for the node package.
+
+Loads the package the way ComfyUI loads custom nodes, in a fresh interpreter
+per run, and fails if the median import time exceeds the budget or if any of
+the heavy SDKs are imported eagerly. Modules ComfyUI has already imported by
+the time custom nodes load (torch, numpy, PIL, folder_paths, comfy) are
+imported before the timer starts.
+
+    python benchmarks/import_time.py --comfyui /path/to/ComfyUI --budget-ms 150
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported until a node actually runs
+DEFERRED_MODULES = [
+    "boto3",
+    "botocore",
+    "openai",
+    "httpx",
+    "openpyxl",
+    "googleapiclient",
+    "google_auth_oauthlib",
+    "google.oauth2",
+    "httplib2",
+]
+
+CHILD_SCRIPT = r"""
+import importlib.util
+import json
+import os
+import sys
+import time
+
+comfyui_root, package_dir, deferred = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+sys.argv = [sys.argv[0]]
+sys.path.insert(0, comfyui_root)
+os.chdir(comfyui_root)
+
+# already loaded by ComfyUI before custom nodes
+import numpy, torch, PIL.Image, folder_paths, comfy.cli_args
+
+module_name = os.path.basename(package_dir).replace("-", "_")
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location(
+    module_name, os.path.join(package_dir, "__init__.py"), submodule_search_locations=[package_dir]
+)
+module = importlib.util.module_from_spec(spec)
+sys.modules[module_name] = module
+spec.loader.exec_module(module)
+elapsed = time.perf_counter() - started
+
+print(json.dumps({
+    "ms": elapsed * 1000,
+    "nodes": len(module.NODE_CLASS_MAPPINGS),
+    "eager": [name for name in deferred if name in sys.modules],
+}))
+"""
+
+
+def measure(comfyui_root, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD_SCRIPT, comfyui_root, PACKAGE_DIR, json.dumps(DEFERRED_MODULES)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comfyui", default=os.getenv("COMFYUI_ROOT"), help="Path to a ComfyUI checkout.")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="Maximum median import time.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if not args.comfyui:
+        parser.error("--comfyui (or COMFYUI_ROOT) is required")
+
+    samples = measure(os.path.abspath(args.comfyui), args.runs)
+    times = sorted(sample["ms"] for sample in samples)
+    median = statistics.median(times)
+    eager = sorted({name for sample in samples for name in sample["eager"]})
+
+    print(f"import time: median {median:.1f} ms, min {times[0]:.1f} ms, max {times[-1]:.1f} ms "
+          f"over {args.runs} runs ({samples[0]['nodes']} nodes)")
+
+    failed = False
+    if median > args.budget_ms:
+        print(f"FAIL: median import time {median:.1f} ms exceeds budget {args.budget_ms:.1f} ms")
+        failed = True
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Offline throughput benchmarks for the nodes.
+
+Starts local stand-ins for the OpenAI, S3 and Google Drive APIs
+(benchmarks/fake_servers.py), then runs each node over synthetic image
+batches in a fresh interpreter per scenario and reports images (or
+requests) per second, per-call latency percentiles and peak RSS. A
+percentile is only reported once there are enough calls to tell it apart
+from the maximum (10 for p90, 100 for p99), so raise --iterations for
+tail latencies. Needs a
+ComfyUI checkout and the package requirements, but no GPU, network or
+cloud credentials.
+
+    python benchmarks/run_benchmarks.py --comfyui /path/to/ComfyUI
+    python benchmarks/run_benchmarks.py --comfyui /path/to/ComfyUI --scenarios save_s3 save_multi --batch 16
+    python benchmarks/run_benchmarks.py --comfyui /path/to/ComfyUI --openai-latency 0.5 --openai-rpm 120
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_servers import FakeDriveServer, FakeOpenAIServer, FakeS3Server
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- scenarios (run in the child process) -------------------------------------
+
+def _generate(nodes, images, args):
+    node = nodes["CESILK_OpenAIImageBatchGenerator"]()
+    prompts = "\n".join(f"a tiger in the snow, variation {i}" for i in range(args.batch))
+
+    def run():
+        node.generate_images("gpt-image-1", "1:1", 1, "photo", prompts, False,
+                             concurrent=True, max_concurrency=args.concurrency)
+    return run, args.batch
+
+
+def _describe(nodes, images, args, **options):
+    node = nodes["CESILK_OpenAIImageDescriptionToTextfile"]()
+
+    def run():
+        node.images_description_to_textfile(images, "Describe the image.", True, "bench/describe",
+                                            False, "", "", "A", 2,
+                                            max_concurrent_requests=args.concurrency, **options)
+    return run, len(images)
+
+
+def _chat(nodes, images, args, stream=False):
+    node = nodes["CESILK_OpenAIChat"]()
+
+    def run():
+        node.chat("gpt-4.1", "You are a benchmark.", "Say something.", stream=stream)
+    return run, 1
+
+
+def _save_s3(nodes, images, args):
+    node = nodes["CESILK_SaveAndUploadToS3"]()
+
+    def run():
+        node.save_image_to_s3(images, "bench/s3", True, "bench", "bench/", encode_workers=args.encode_workers,
+                              output_format=args.output_format)
+    return run, len(images)
+
+
+def _save_gdrive(nodes, images, args):
+    node = nodes["CESILK_SaveAndUploadToGoogleDrive"]()
+    node._node_dir = os.environ["BENCH_GDRIVE_NODE_DIR"]
+
+    def run():
+        node.save_image_to_gdrive(images, True, "bench", "gdrive", encode_workers=args.encode_workers,
+                                  output_format=args.output_format)
+    return run, len(images)
+
+
+def _save_multi(nodes, images, args):
+    node = nodes["CESILK_SaveAndUploadToSinks"]()
+    node._node_dir = os.environ["BENCH_GDRIVE_NODE_DIR"]
+
+    def run():
+        node.save_and_upload(images, "bench/multi", True, True, "bench", "bench/multi/", True, "bench",
+                             encode_workers=args.encode_workers, output_format=args.output_format)
+    return run, len(images)
+
+
+SCENARIOS = {
+    "generate": _generate,
+    "describe": _describe,
+    "describe_packed": lambda nodes, images, args: _describe(nodes, images, args, images_per_request=4),
+    "describe_batch": lambda nodes, images, args: _describe(nodes, images, args, batch_mode=True, batch_poll_interval=1),
+    "chat": _chat,
+    "chat_stream": lambda nodes, images, args: _chat(nodes, images, args, stream=True),
+    "save_s3": _save_s3,
+    "save_gdrive": _save_gdrive,
+    "save_multi": _save_multi,
+}
+
+
+def run_scenario(args):
+    sys.path.insert(0, args.comfyui)
+    os.chdir(args.comfyui)
+    sys.argv = [sys.argv[0]]
+
+    import torch
+    import folder_paths
+
+    folder_paths.set_output_directory(args.output_dir)
+
+    module_name = os.path.basename(PACKAGE_DIR).replace("-", "_")
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(PACKAGE_DIR, "__init__.py"), submodule_search_locations=[PACKAGE_DIR]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    torch.manual_seed(0)
+    images = torch.rand(args.batch, args.height, args.width, 3)
+    run, items = SCENARIOS[args.scenario](module.NODE_CLASS_MAPPINGS, images, args)
+
+    for _ in range(args.warmup):
+        run()
+    latencies = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+
+    print(json.dumps({
+        "scenario": args.scenario,
+        "items": items * args.iterations,
+        "latencies": latencies,
+        # KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+# --- parent -------------------------------------------------------------------
+
+# fewest samples for which the percentile is not simply the slowest call
+MIN_SAMPLES = {50: 2, 90: 10, 99: 100}
+
+
+def _percentile(values, q):
+    if len(values) < MIN_SAMPLES[q]:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def _write_fake_credentials(work_dir):
+    aws_config = os.path.join(work_dir, "aws_config")
+    with open(aws_config, "w") as f:
+        f.write("[default]\nregion = ap-northeast-1\n")
+    aws_credentials = os.path.join(work_dir, "aws_credentials")
+    with open(aws_credentials, "w") as f:
+        f.write("[default]\naws_access_key_id = fake\naws_secret_access_key = fake\n")
+
+    gdrive_dir = os.path.join(work_dir, "gdrive")
+    os.makedirs(gdrive_dir)
+    with open(os.path.join(gdrive_dir, "token.json"), "w") as f:
+        json.dump({
+            "token": "fake", "refresh_token": "fake", "client_id": "fake", "client_secret": "fake",
+            "scopes": ["https://www.googleapis.com/auth/drive.file"], "expiry": "2099-01-01T00:00:00Z",
+        }, f)
+    return aws_config, aws_credentials, gdrive_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comfyui", default=os.getenv("COMFYUI_ROOT"), help="Path to a ComfyUI checkout.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--batch", type=int, default=8, help="Images per node call.")
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--iterations", type=int, default=20, help="Timed node calls per scenario.")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent OpenAI requests per node call.")
+    parser.add_argument("--encode-workers", type=int, default=0)
+    parser.add_argument("--output-format", default="png", help="Output format of the save nodes, e.g. png, \"png (store)\", webp, jpeg.")
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="Seconds added to every OpenAI response.")
+    parser.add_argument("--openai-jitter", type=float, default=0.05)
+    parser.add_argument("--openai-rpm", type=int, default=0, help="Requests per minute before the fake API answers 429. 0 is unlimited.")
+    parser.add_argument("--storage-latency", type=float, default=0.02, help="Seconds added to every S3/Drive request.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--scenario-child", dest="scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not args.comfyui:
+        parser.error("--comfyui (or COMFYUI_ROOT) is required")
+    args.comfyui = os.path.abspath(args.comfyui)
+
+    if args.scenario:
+        return run_scenario(args)
+
+    openai_server = FakeOpenAIServer(args.openai_latency, args.openai_jitter, args.openai_rpm, batch_delay=1.0)
+    s3_server = FakeS3Server(args.storage_latency)
+    drive_server = FakeDriveServer(args.storage_latency)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir, openai_server, s3_server, drive_server:
+        aws_config, aws_credentials, gdrive_dir = _write_fake_credentials(work_dir)
+        env = dict(
+            os.environ,
+            OPENAI_API_KEY="fake",
+            OPENAI_BASE_URL=f"{openai_server.url}/v1",
+            CESILK_OPENAI_CACHE_DIR=os.path.join(work_dir, "openai_cache"),
+            CESILK_S3_ENDPOINT_URL=s3_server.url,
+            CESILK_S3_UPLOAD_JOURNAL=os.path.join(work_dir, "s3_upload_journal.jsonl"),
+            AWS_CONFIG_FILE=aws_config,
+            AWS_SHARED_CREDENTIALS_FILE=aws_credentials,
+            # keep the request bodies plain for the stand-in
+            AWS_REQUEST_CHECKSUM_CALCULATION="when_required",
+            CESILK_GDRIVE_API_ENDPOINT=f"{drive_server.url}/drive/v3/",
+            CESILK_GDRIVE_UPLOAD_SESSIONS=os.path.join(work_dir, "gdrive_upload_sessions.json"),
+            GDRIVE_ROOT_ID="bench-root",
+            BENCH_GDRIVE_NODE_DIR=gdrive_dir,
+        )
+
+        for scenario in args.scenarios:
+            output_dir = os.path.join(work_dir, "output", scenario)
+            os.makedirs(output_dir)
+            command = [
+                sys.executable, os.path.abspath(__file__), "--comfyui", args.comfyui,
+                "--scenario-child", scenario, "--output-dir", output_dir,
+                "--batch", str(args.batch), "--width", str(args.width), "--height", str(args.height),
+                "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+                "--concurrency", str(args.concurrency), "--encode-workers", str(args.encode_workers),
+                "--output-format", args.output_format,
+            ]
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{scenario}: FAILED\n{completed.stderr.strip()}")
+                continue
+
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            latencies = result["latencies"]
+            result.update(
+                items_per_sec=result["items"] / sum(latencies),
+                samples=len(latencies),
+                mean_ms=statistics.mean(latencies) * 1000,
+            )
+            for q in MIN_SAMPLES:
+                value = _percentile(latencies, q)
+                result[f"p{q}_ms"] = value * 1000 if value is not None else None
+            results.append(result)
+            percentiles = "   ".join(
+                f"p{q} {result[f'p{q}_ms']:8.1f} ms" if result[f"p{q}_ms"] is not None else f"p{q} {'-':>8}   "
+                for q in MIN_SAMPLES
+            )
+            print(f"{scenario:<16} {result['items_per_sec']:8.2f} items/s   {percentiles}   "
+                  f"peak RSS {result['peak_rss_mb']:7.1f} MB   ({len(latencies)} calls)")
+
+        print(f"fake servers: {openai_server.requests} OpenAI, {s3_server.requests} S3, "
+              f"{drive_server.requests} Drive requests; {s3_server.bytes_received / 1e6:.1f} MB to S3, "
+              f"{drive_server.bytes_received / 1e6:.1f} MB to Drive")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("scenario", "output_dir")},
+                       "results": results}, f, indent=2)
+    sys.exit(0 if len(results) == len(args.scenarios) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .image_utils import build_exif, build_pnginfo
+from .metrics import count, timed
+
+
+PNG_CONTENT_TYPE = "image/png"
+
+# node option -> (file extension, content type)
+OUTPUT_FORMATS = {
+    "png": ("png", PNG_CONTENT_TYPE),
+    "png (store)": ("png", PNG_CONTENT_TYPE),
+    "webp (lossless)": ("webp", "image/webp"),
+    "webp": ("webp", "image/webp"),
+    "jpeg": ("jpg", "image/jpeg"),
+}
+OUTPUT_FORMAT_NAMES = list(OUTPUT_FORMATS)
+
+# JPEG keeps EXIF in a single APP1 segment
+JPEG_MAX_EXIF_BYTES = 65533
+
+# optional inputs shared by the save nodes, matching encode_image() and resolve_encode_workers()
+ENCODE_INPUTS = {
+    "encode_workers": (
+        "INT",
+        {
+            "default": 0,
+            "min": 0,
+            "max": 64,
+            "step": 1,
+            "tooltip": "Number of threads encoding images in parallel. 0 uses one per CPU core."
+        }
+    ),
+    "output_format": (OUTPUT_FORMAT_NAMES, {"default": "png", "tooltip": "png (store) skips compression for the fastest saves. webp/jpeg are lossy and much smaller."}),
+    "compress_level": (
+        "INT",
+        {
+            "default": 4,
+            "min": 0,
+            "max": 9,
+            "step": 1,
+            "tooltip": "Encoder effort for png and webp. Higher is smaller but slower."
+        }
+    ),
+    "quality": (
+        "INT",
+        {
+            "default": 90,
+            "min": 1,
+            "max": 100,
+            "step": 1,
+            "tooltip": "Quality of the lossy webp/jpeg formats."
+        }
+    ),
+}
+
+
+def encode_png(img, metadata=None, compress_level=4) -> bytes:
+    with timed("encode", format="png"):
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG", pnginfo=metadata, compress_level=compress_level)
+        data = buffer.getvalue()
+    count("bytes_encoded", len(data), format="png")
+    return data
+
+
+def build_image_metadata(output_format, prompt=None, extra_pnginfo=None):
+    # PNG text chunks for PNG, EXIF for WebP/JPEG
+    if OUTPUT_FORMATS[output_format][0] == "png":
+        return build_pnginfo(prompt, extra_pnginfo)
+    return build_exif(prompt, extra_pnginfo)
+
+
+def encode_image(img, output_format="png", metadata=None, compress_level=4, quality=90) -> bytes:
+    """
+    Encodes ``img`` in one of OUTPUT_FORMATS. ``metadata`` comes from
+    build_image_metadata() for the same format.
+
+    compress_level (0-9) is the effort of the lossless formats and of the
+    WebP encoder; quality (1-100) applies to lossy WebP and JPEG.
+    """
+    if output_format == "png":
+        return encode_png(img, metadata, compress_level)
+    if output_format == "png (store)":
+        # no zlib compression at all: the fastest format, and the largest files
+        return encode_png(img, metadata, 0)
+
+    extension = OUTPUT_FORMATS[output_format][0]
+    options = {}
+    if metadata:
+        options["exif"] = metadata
+    if output_format == "webp (lossless)":
+        # lossless WebP reads quality as effort
+        options.update(format="WEBP", lossless=True, quality=round(compress_level * 100 / 9),
+                       method=min(6, compress_level * 2 // 3))
+    elif output_format == "webp":
+        options.update(format="WEBP", quality=quality, method=min(6, compress_level * 2 // 3))
+    else:
+        if metadata and len(metadata) > JPEG_MAX_EXIF_BYTES:
+            print(f"Workflow metadata is {len(metadata)} bytes, too large for JPEG EXIF; saving without it")
+            del options["exif"]
+        options.update(format="JPEG", quality=quality)
+
+    with timed("encode", format=extension):
+        buffer = io.BytesIO()
+        img.save(buffer, **options)
+        data = buffer.getvalue()
+    count("bytes_encoded", len(data), format=extension)
+    return data
+
+
+def resolve_encode_workers(requested: int, count: int) -> int:
+    # 0 means one worker per CPU core
+    return max(1, min(count, requested or os.cpu_count() or 1))
+
+
+def map_ordered(fn, items, workers: int):
+    """
+    Like map(), but runs fn on a thread pool. Results are yielded in input order.
+
+    PNG/zlib encoding in Pillow releases the GIL, so threads scale across
+    cores without pickling whole images to worker processes.
+    """
+    if workers <= 1 or len(items) <= 1:
+        yield from map(fn, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(fn, items)
+
+
+def write_file(path: str, data: bytes):
+    with timed("write", sink="local"):
+        with open(path, "wb") as f:
+            f.write(data)
+    count("bytes_written", len(data), sink="local")
+
+
+def upload_bytes_to_s3(client, data: bytes, bucket: str, key: str, transfer_config=None,
+                       content_type: str = PNG_CONTENT_TYPE, metadata=None):
+    extra_args = {"ContentType": content_type}
+    if metadata:
+        extra_args["Metadata"] = metadata
+    with timed("upload", sink="s3"):
+        client.upload_fileobj(
+            io.BytesIO(data), bucket, key,
+            ExtraArgs=extra_args,
+            Config=transfer_config,
+        )
+    count("bytes_uploaded", len(data), sink="s3")
+    print(f"upload image success. S3 Key: {key}")
+
+
+class SinkFanout:
+    """
+    Runs sink writes (local disk, S3, Drive, ...) for already encoded images
+    concurrently, so one encoded buffer can be sent to every destination while
+    the next image is being encoded.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = self._executor.submit(fn, *args, **kwargs)
+        self._futures.append(future)
+        return future
+
+    def wait(self):
+        # Let every sink finish before surfacing the first error
+        wait(self._futures)
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self.close()
+        return False
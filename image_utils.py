@@ -0,0 +1,47 @@
+import json
+
+import torch
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+from .metrics import timed
+
+
+def images_to_uint8(images):
+    """
+    Converts an IMAGE batch ([B, H, W, C] floats in 0..1) to a uint8 numpy array.
+
+    The scale/clamp/cast runs on the tensor's device as one fused pass over the
+    whole batch, and only the uint8 result is copied to the CPU. The result is
+    C-contiguous even for permuted views (e.g. ImageScale output), so each
+    image can be hashed or handed to PIL without another copy.
+    """
+    with timed("to_uint8"):
+        return images.mul(255.0).clamp_(0, 255).to(torch.uint8).contiguous().cpu().numpy()
+
+
+def build_pnginfo(prompt=None, extra_pnginfo=None) -> PngInfo:
+    # Built once per batch; Pillow only reads the chunks while saving, so the
+    # same PngInfo can be shared by every image (and encoder thread).
+    metadata = PngInfo()
+    if prompt is not None:
+        metadata.add_text("prompt", json.dumps(prompt))
+    if extra_pnginfo is not None:
+        for x in extra_pnginfo:
+            metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+    return metadata
+
+
+def build_exif(prompt=None, extra_pnginfo=None) -> bytes:
+    # Same layout as ComfyUI's WebP saver: the prompt in Model (0x0110), each
+    # extra_pnginfo entry in the tags counting down from Make (0x010f).
+    # Serialized once so encoder threads only share immutable bytes.
+    exif = Image.Exif()
+    if prompt is not None:
+        exif[0x0110] = "prompt:{}".format(json.dumps(prompt))
+    if extra_pnginfo is not None:
+        tag = 0x010f
+        for x in extra_pnginfo:
+            exif[tag] = "{}:{}".format(x, json.dumps(extra_pnginfo[x]))
+            tag -= 1
+    return exif.tobytes()
@@ -0,0 +1,24 @@
+import json
+import os
+
+
+def append_record(path: str, record: dict):
+    """Appends one JSON line to ``path`` and fsyncs it, so a finished step survives a crash."""
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_records(path: str):
+    """Yields the records of a JSONL journal in order. A missing file has none."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # a torn last line from a crash mid-write
+                continue
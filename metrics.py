@@ -0,0 +1,198 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Off unless CESILK_METRICS is set. When off, every helper below returns after
+# a single flag check, so the instrumented code paths cost next to nothing.
+ENABLED = os.getenv("CESILK_METRICS", "").lower() not in ("", "0", "false", "no")
+
+JSON_LOG_PATH = os.getenv("CESILK_METRICS_JSON_LOG")
+PROM_FILE_PATH = os.getenv("CESILK_METRICS_PROM_FILE")
+PROM_FILE_INTERVAL = float(os.getenv("CESILK_METRICS_PROM_INTERVAL", 10))
+PROM_PORT = int(os.getenv("CESILK_METRICS_PORT", 0))
+# loopback only unless the scrape endpoint is meant to be reachable from other hosts
+PROM_HOST = os.getenv("CESILK_METRICS_HOST", "127.0.0.1")
+
+PREFIX = "cesilk_"
+
+_NULL_TIMER = nullcontext()
+
+
+class MetricsRegistry:
+    """
+    In-process counters and duration summaries with Prometheus text output.
+
+    Every event is also appended to the JSON log (one object per line) when a
+    log path is configured.
+    """
+
+    def __init__(self, json_log_path=None):
+        self._lock = threading.Lock()
+        self._counters = {}
+        # (name, labels) -> [count, sum, max]
+        self._summaries = {}
+        self._log = open(json_log_path, "a", encoding="utf-8", buffering=1) if json_log_path else None
+
+    def count(self, name, value=1, labels=()):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._write_log("counter", name, value, labels)
+
+    def observe(self, name, value, labels=()):
+        with self._lock:
+            summary = self._summaries.get((name, labels))
+            if summary is None:
+                summary = self._summaries[(name, labels)] = [0, 0.0, 0.0]
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+        self._write_log("duration", name, value, labels)
+
+    def _write_log(self, kind, name, value, labels):
+        if self._log is None:
+            return
+        line = json.dumps({"ts": time.time(), "type": kind, "metric": name, "value": value, **dict(labels)})
+        with self._lock:
+            self._log.write(line + "\n")
+
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            summaries = sorted((key, list(value)) for key, value in self._summaries.items())
+
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        for (name, labels), (count, total, maximum) in summaries:
+            metric = f"{PREFIX}{name}_seconds"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} summary")
+                seen.add(metric)
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+        for (name, labels), (count, total, maximum) in summaries:
+            metric = f"{PREFIX}{name}_seconds_max"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} gauge")
+                seen.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {maximum:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prom_file(self, path):
+        # write and swap so a scraper (e.g. node_exporter textfile collector) never sees a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels
+        if exc_type is not None:
+            labels = labels + (("error", exc_type.__name__),)
+        get_registry().observe(self.name, time.perf_counter() - self.started, labels)
+        return False
+
+
+def timed(stage, **labels):
+    """Context manager recording the duration of ``stage`` as cesilk_stage_seconds."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer("stage", (("stage", stage),) + tuple(sorted(labels.items())))
+
+
+def count(name, value=1, **labels):
+    """Adds ``value`` to the counter cesilk_<name>_total."""
+    if not ENABLED or not value:
+        return
+    get_registry().count(name, value, tuple(sorted(labels.items())))
+
+
+def observe(name, seconds, **labels):
+    """Records a duration measured elsewhere as cesilk_<name>_seconds."""
+    if not ENABLED:
+        return
+    get_registry().observe(name, seconds, tuple(sorted(labels.items())))
+
+
+def _start_prom_file_writer(registry, path, interval):
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.write_prom_file(path)
+            except OSError as e:
+                print(f"Could not write metrics to {path}: {e}")
+
+    threading.Thread(target=loop, name="cesilk-metrics-file", daemon=True).start()
+    atexit.register(registry.write_prom_file, path)
+
+
+def _start_prom_server(registry, host, port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="cesilk-metrics-http", daemon=True).start()
+    print(f"Serving cesilk metrics on {host}:{port}")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    global _registry
+    if _registry is not None:
+        return _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = MetricsRegistry(JSON_LOG_PATH)
+            if PROM_FILE_PATH:
+                _start_prom_file_writer(registry, PROM_FILE_PATH, PROM_FILE_INTERVAL)
+            if PROM_PORT:
+                _start_prom_server(registry, PROM_HOST, PROM_PORT)
+            _registry = registry
+        return _registry
@@ -0,0 +1,156 @@
+import json
+import os
+import time
+import uuid
+
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class OpenAIBatchTransport:
+    """
+    Batch API transport backed by an OpenAI client.
+
+    run_chat_batch only uses the four methods below, so any object with the
+    same interface can be passed instead (e.g. a stand-in that talks to a
+    local test server).
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def upload_file(self, path: str) -> str:
+        with open(path, "rb") as f:
+            return self.client.files.create(file=f, purpose="batch").id
+
+    def create_batch(self, input_file_id: str, endpoint: str) -> str:
+        batch = self.client.batches.create(
+            input_file_id=input_file_id,
+            endpoint=endpoint,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def retrieve_batch(self, batch_id: str) -> dict:
+        batch = self.client.batches.retrieve(batch_id)
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+        }
+
+    def download_file(self, file_id: str) -> str:
+        return self.client.files.content(file_id).text
+
+
+# Batch API input file limits
+MAX_BATCH_REQUESTS = 50_000
+MAX_BATCH_BYTES = 200 * 1000 * 1000
+
+
+def _custom_id(index: int) -> str:
+    return f"request-{index}"
+
+
+def _write_batch_files(bodies, work_dir: str):
+    """
+    Writes the request lines into as many input files as the Batch API limits
+    need and yields (path, first index, request count) for each finished file.
+    """
+    path = None
+    f = None
+    first = size = index = 0
+    try:
+        for index, body in enumerate(bodies):
+            line = json.dumps({
+                "custom_id": _custom_id(index),
+                "method": "POST",
+                "url": CHAT_COMPLETIONS_ENDPOINT,
+                "body": body,
+            }, ensure_ascii=False).encode("utf-8") + b"\n"
+            if f is not None and (index - first >= MAX_BATCH_REQUESTS or size + len(line) > MAX_BATCH_BYTES):
+                f.close()
+                f = None
+                yield path, first, index - first
+            if f is None:
+                path = os.path.join(work_dir, f"batch_{uuid.uuid4().hex}.jsonl")
+                f = open(path, "wb")
+                first, size = index, 0
+            f.write(line)
+            size += len(line)
+        if f is not None:
+            f.close()
+            f = None
+            yield path, first, index + 1 - first
+    finally:
+        if f is not None:
+            f.close()
+            os.remove(path)
+
+
+def _read_batch_results(transport, batch, results, errors):
+    for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+        if not file_id:
+            continue
+        for line in transport.download_file(file_id).splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+            else:
+                errors[record["custom_id"]] = record.get("error") or response.get("body")
+
+
+def run_chat_batch(transport, bodies, work_dir: str, poll_interval: float = 30, timeout: float = 24 * 60 * 60):
+    """
+    Submits chat completion request bodies as Batch API jobs and waits for them.
+    Bodies are split over several jobs when they exceed the input file limits
+    (50,000 requests / 200 MB per file).
+
+    Returns (results, errors): the message contents in the same order as
+    ``bodies``, with None for requests that failed, expired or timed out, and
+    the error of each failed request by its index.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Written line by line so the (base64 heavy) bodies are never all held in memory
+    jobs = []
+    for input_path, first, count in _write_batch_files(bodies, work_dir):
+        try:
+            input_file_id = transport.upload_file(input_path)
+        finally:
+            os.remove(input_path)
+        batch_id = transport.create_batch(input_file_id, CHAT_COMPLETIONS_ENDPOINT)
+        print(f"Submitted batch {batch_id} with {count} requests")
+        jobs.append((batch_id, first, count))
+
+    total = sum(count for _, _, count in jobs)
+    results = {}
+    errors = {}
+    deadline = time.monotonic() + timeout
+    running = list(jobs)
+    while running:
+        for job in list(running):
+            batch_id, first, count = job
+            batch = transport.retrieve_batch(batch_id)
+            if batch["status"] in TERMINAL_STATUSES:
+                print(f"Batch {batch_id} finished with status: {batch['status']}")
+            elif time.monotonic() > deadline:
+                print(f"Batch {batch_id} did not finish within {timeout} seconds (status: {batch['status']})")
+                for index in range(first, first + count):
+                    errors.setdefault(_custom_id(index), f"batch {batch_id} timed out ({batch['status']})")
+            else:
+                continue
+            running.remove(job)
+            _read_batch_results(transport, batch, results, errors)
+            for index in range(first, first + count):
+                if _custom_id(index) not in results:
+                    errors.setdefault(_custom_id(index), f"no result in batch {batch_id} ({batch['status']})")
+        if running:
+            time.sleep(poll_interval)
+
+    failed = {index: errors[_custom_id(index)] for index in range(total) if _custom_id(index) not in results}
+    return [results.get(_custom_id(index)) for index in range(total)], failed
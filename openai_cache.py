@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from .metrics import count
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".openai_cache")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60  # 7 days
+# eviction frees space down to this fraction of max_bytes, so a full cache is not rescanned on every put
+EVICT_TO = 0.9
+
+META_FILE = "meta.json"
+TEXT_FILE = "response.txt"
+
+
+def _digest_data_urls(value):
+    # Inline images (data:image/...;base64,...) are replaced by a hash of their
+    # bytes so keys stay small and identical images map to the same key.
+    if isinstance(value, str):
+        if value.startswith("data:") and "," in value:
+            header, payload = value.split(",", 1)
+            return f"{header},sha256:{hashlib.sha256(payload.encode('ascii')).hexdigest()}"
+        return value
+    if isinstance(value, dict):
+        return {k: _digest_data_urls(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_digest_data_urls(v) for v in value]
+    return value
+
+
+def make_cache_key(endpoint: str, model: str, messages=None, **params) -> str:
+    material = {
+        "endpoint": endpoint,
+        "model": model,
+        "messages": _digest_data_urls(messages),
+        "params": params,
+    }
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for OpenAI responses.
+
+    Each entry is a directory holding meta.json plus the payload: text is
+    stored as-is in response.txt, images as their decoded bytes (not base64).
+    Entries expire after ``ttl`` seconds and the least recently used entries
+    are evicted once the cache grows beyond ``max_bytes``.
+    """
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # running size of the entries, from one scan of the directory; None until the first put
+        self._total = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def get_text(self, key: str):
+        entry = self._lookup(key, "text")
+        if entry is None:
+            return None
+        with open(os.path.join(entry, TEXT_FILE), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def put_text(self, key: str, text: str):
+        def write(tmp_dir):
+            with open(os.path.join(tmp_dir, TEXT_FILE), "w", encoding="utf-8") as f:
+                f.write(text)
+            return {"kind": "text"}
+
+        self._store(key, write)
+
+    def get_images(self, key: str):
+        entry = self._lookup(key, "images")
+        if entry is None:
+            return None
+        with open(os.path.join(entry, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        images = []
+        for name in meta["files"]:
+            with open(os.path.join(entry, name), "rb") as f:
+                images.append(f.read())
+        return images
+
+    def put_images(self, key: str, images):
+        def write(tmp_dir):
+            files = []
+            for i, image_bytes in enumerate(images):
+                name = f"image_{i:04}.bin"
+                with open(os.path.join(tmp_dir, name), "wb") as f:
+                    f.write(image_bytes)
+                files.append(name)
+            return {"kind": "images", "files": files}
+
+        self._store(key, write)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _lookup(self, key: str, kind: str):
+        entry = self._entry_dir(key)
+        meta_path = os.path.join(entry, META_FILE)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            count("openai_cache_requests", result="miss", kind=kind)
+            return None
+
+        if meta.get("kind") != kind or time.time() - meta.get("created", 0) > self.ttl:
+            with self._lock:
+                shutil.rmtree(entry, ignore_errors=True)
+                if self._total is not None:
+                    self._total -= meta.get("size", 0)
+            count("openai_cache_requests", result="miss", kind=kind)
+            return None
+
+        # meta.json mtime doubles as the last access time for LRU eviction
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        count("openai_cache_requests", result="hit", kind=kind)
+        return entry
+
+    def _store(self, key: str, write):
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            meta = write(tmp_dir)
+            meta["created"] = time.time()
+            meta["size"] = sum(
+                os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir)
+            )
+            with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+            entry = self._entry_dir(key)
+            with self._lock:
+                if self._total is None:
+                    self._evict()
+                os.makedirs(os.path.dirname(entry), exist_ok=True)
+                self._total -= self._entry_size(entry)
+                shutil.rmtree(entry, ignore_errors=True)
+                os.replace(tmp_dir, entry)
+                self._total += meta["size"]
+                # only walk the whole cache once it has actually grown too big
+                if self._total > self.max_bytes:
+                    self._evict()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _entry_size(self, entry):
+        try:
+            with open(os.path.join(entry, META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f).get("size", 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _evict(self):
+        # drops expired entries and the least recently used ones beyond max_bytes,
+        # and recounts the running total
+        now = time.time()
+        entries = []
+        total = 0
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if shard.startswith(".") or not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                entry = os.path.join(shard_dir, key)
+                meta_path = os.path.join(entry, META_FILE)
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    accessed = os.path.getmtime(meta_path)
+                except (OSError, ValueError):
+                    shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                if now - meta.get("created", 0) > self.ttl:
+                    shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                size = meta.get("size", 0)
+                entries.append((accessed, size, entry))
+                total += size
+
+        if total > self.max_bytes:
+            for _, size, entry in sorted(entries):
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+        self._total = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                os.getenv("CESILK_OPENAI_CACHE_DIR") or DEFAULT_CACHE_DIR,
+                max_bytes=int(os.getenv("CESILK_OPENAI_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                ttl=float(os.getenv("CESILK_OPENAI_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+            )
+        return _cache
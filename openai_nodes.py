@@ -1,32 +1,76 @@
 import base64
+import collections
+import hashlib
 import io
+import json
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from dotenv import load_dotenv
 import numpy as np
 import torch
-from openai import OpenAI
-from openpyxl import load_workbook
 from PIL import Image
 
 import folder_paths
 
+from .image_utils import images_to_uint8
+from .metrics import count, observe, timed
+from .openai_batch import OpenAIBatchTransport, run_chat_batch
+from .openai_cache import get_response_cache, make_cache_key
+from .openai_ratelimit import estimate_tokens, get_rate_limiter
+from .prompt_sources import iter_file_prompts
+from .result_writers import EXCEL_OUTPUTS, open_result_writer
+from .run_journal import item_key, open_run_journal
+
 
 load_dotenv()
 
+DESCRIPTION_MODEL = "gpt-4.1"
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def create_openai_client():
+    # One client (and so one keep-alive connection pool) per API key and base URL,
+    # shared by every node execution in the process.
+    # openai/httpx are imported here rather than at module level to keep ComfyUI startup fast.
+    import httpx
+    from openai import DefaultHttpxClient, OpenAI
 
-def create_openai_client() -> OpenAI:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise EnvironmentError("OPENAI_API_KEY not found in environment variables.")
-    return OpenAI(api_key=api_key)
+    base_url = os.getenv("OPENAI_BASE_URL") or None
+
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            http_client = DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("CESILK_OPENAI_MAX_CONNECTIONS", 100)),
+                    max_keepalive_connections=int(os.getenv("CESILK_OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20)),
+                    keepalive_expiry=float(os.getenv("CESILK_OPENAI_KEEPALIVE_EXPIRY", 60)),
+                ),
+                timeout=httpx.Timeout(
+                    float(os.getenv("CESILK_OPENAI_TIMEOUT", 600)),
+                    connect=float(os.getenv("CESILK_OPENAI_CONNECT_TIMEOUT", 10)),
+                ),
+            )
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            _clients[(api_key, base_url)] = client
+    return client
 
 
 class OpenAIImageBatchGenerator:
     mdoels = ["dall-e-3", "gpt-image-1"]
     aspect_ratios = ["1:1", "3:2 (landscape)", "2:3 (portrait)"]
+    single_image_models = ("dall-e-3",)
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -40,21 +84,79 @@ class OpenAIImageBatchGenerator:
                         "default": 1,
                         "min": 1,
                         "max": 10,
-                        "step": 1
+                        "step": 1,
+                        "tooltip": "Images per prompt. dall-e-3 makes one request per image."
                     }
                 ),
                 "style_indication": ("STRING", {"multiline": True, "tooltip": "Style instructions for the image generation."}),
                 "prompt_string": ("STRING", {"multiline": True}),
                 "multiline": ("BOOLEAN", {"default": False}),
+            },
+            "optional": {
+                "concurrent": ("BOOLEAN", {"default": False, "tooltip": "Send the generation requests in parallel."}),
+                "max_concurrency": (
+                    "INT",
+                    {
+                        "default": 4,
+                        "min": 1,
+                        "max": 32,
+                        "step": 1,
+                        "tooltip": "Maximum number of in-flight requests when concurrent is enabled."
+                    }
+                ),
+                "use_cache": ("BOOLEAN", {"default": False, "tooltip": "Reuse locally cached results for identical requests."}),
+                "prompt_file": ("STRING", {"default": "", "multiline": False, "tooltip": "CSV or Excel file to read prompts from instead of prompt_string. Read in chunks, never loaded whole."}),
+                "prompt_sheet_name": ("STRING", {"default": "", "multiline": False, "tooltip": "Excel sheet name. Empty uses the active sheet."}),
+                "prompt_column": ("STRING", {"default": "A", "multiline": False, "tooltip": "Column holding the prompts. Example: Column A"}),
+                "prompt_start_row": (
+                    "INT",
+                    {
+                        "default": 2,
+                        "min": 1,
+                        "max": 1048576,
+                        "step": 1,
+                        "tooltip": "First row of the prompt column (below the header)."
+                    }
+                ),
+                "prompt_offset": (
+                    "INT",
+                    {
+                        "default": 0,
+                        "min": 0,
+                        "max": 0xffffffff,
+                        "step": 1,
+                        "tooltip": "Number of prompts to skip. Increase by prompt_limit per run to page through the file."
+                    }
+                ),
+                "prompt_limit": (
+                    "INT",
+                    {
+                        "default": 16,
+                        "min": 1,
+                        "max": 10000,
+                        "step": 1,
+                        "tooltip": "Maximum number of prompts read from the file per run."
+                    }
+                ),
+                "run_id": ("STRING", {"default": "", "multiline": False, "tooltip": "Journal completed requests under this ID. Rerunning with the same ID skips them and reuses their images."}),
             }
         }
 
-    RETURN_TYPES = ("IMAGE",)
-    RETURN_NAMES = ("images",)
+    @classmethod
+    def IS_CHANGED(cls, prompt_file="", **kwargs):
+        # re-run when the prompt file is edited, even if the node inputs stay the same
+        if prompt_file and os.path.exists(prompt_file):
+            return os.path.getmtime(prompt_file)
+        return ""
+
+    RETURN_TYPES = ("IMAGE", "MASK")
+    RETURN_NAMES = ("images", "masks")
     FUNCTION = "generate_images"
     CATEGORY = "🐅cesilk_nodes"
 
-    def generate_images(self, model, aspect_ratio, batch_size, style_indication, prompt_string, multiline):
+    def generate_images(self, model, aspect_ratio, batch_size, style_indication, prompt_string, multiline,
+                        concurrent=False, max_concurrency=4, use_cache=False, prompt_file="", prompt_sheet_name="",
+                        prompt_column="A", prompt_start_row=2, prompt_offset=0, prompt_limit=16, run_id=""):
         client = create_openai_client()
 
         size_map = {
@@ -72,52 +174,154 @@ class OpenAIImageBatchGenerator:
 
         if aspect_ratio not in size_map[model]:
             raise Exception(f"Invalid aspect ratio '{aspect_ratio}' for model '{model}'")
-    
-        n = 1 if model == "dall-e-3" else batch_size
 
         resolved_size = size_map[model][aspect_ratio]
 
-        if multiline:
+        if prompt_file.strip():
+            prompts = iter_file_prompts(prompt_file.strip(), prompt_sheet_name, prompt_column, prompt_start_row,
+                                        prompt_offset, prompt_limit)
+        elif multiline:
             prompts = [prompt_string.strip()]
         else:
             prompts = [p.strip() for p in prompt_string.strip().split("\n") if p.strip()]
 
-        images = []
-
-        for prompt in prompts:
-            styled_prompt = build_styled_prompt(style_indication, prompt)
-            response = client.images.generate(
-                model=model,
-                prompt=styled_prompt,
-                n=n,
-                size=resolved_size,
-                response_format="b64_json"
-            )
-
-            print(f"Successfully generated image for prompt: {styled_prompt}")
-
-            # Get the generated image
-            for img in response.data:
-                if not img.b64_json:
-                    raise Exception("No image data returned from OpenAI API")
-
-                image_base64 = img.b64_json
-                image_bytes = base64.b64decode(image_base64)
-
-                # Convert to PIL Image
-                generated_image = Image.open(io.BytesIO(image_bytes))
-
-                # Convert to numpy array
-                image_np = np.array(generated_image).astype(np.float32) / 255.0
-                image_np = np.expand_dims(image_np, axis=0)  # Add batch dimension
+        # (prompt, n) per request. dall-e-3 only accepts n=1, so the batch is split
+        # into single-image requests (sent in parallel in concurrent mode).
+        if model in self.single_image_models:
+            per_prompt = [1] * batch_size
+        else:
+            per_prompt = [batch_size]
+        # generator, so file prompts are only read as requests are submitted
+        jobs = enumerate(
+            (build_styled_prompt(style_indication, prompt), n, index)
+            for prompt in prompts
+            for index, n in enumerate(per_prompt)
+        )
+        cache = get_response_cache() if use_cache else None
+        journal = open_run_journal("images", run_id) if run_id.strip() else None
+
+        def run(job):
+            seq, (styled_prompt, n, index) = job
+            if journal is None:
+                return generate(styled_prompt, n, index)
+
+            key = item_key(seq, model, styled_prompt, n, resolved_size, index)
+            done = journal.get(key)
+            if done is not None:
+                print(f"Skipping completed request {seq} of run '{run_id}'")
+                image_data = []
+                for path in done["outputs"]:
+                    with open(path, "rb") as f:
+                        image_data.append(f.read())
+                return image_data
+
+            image_data = generate(styled_prompt, n, index)
+            journal.record(key, seq=seq, outputs=[
+                journal.write_output(key, i, image_bytes) for i, image_bytes in enumerate(image_data)
+            ])
+            return image_data
+
+        def generate(styled_prompt, n, index):
+            if cache is None:
+                return _generate_image_data(client, model, styled_prompt, n, resolved_size)
+
+            # index keeps the split single-image requests of one prompt apart
+            key = make_cache_key("images.generate", model, styled_prompt, n=n, size=resolved_size, index=index)
+            image_data = cache.get_images(key)
+            if image_data is None:
+                image_data = _generate_image_data(client, model, styled_prompt, n, resolved_size)
+                cache.put_images(key, image_data)
+            else:
+                print(f"Using cached image for prompt: {styled_prompt}")
+            return image_data
+
+        image_data = []
+        if concurrent:
+            executor = ThreadPoolExecutor(max_workers=max_concurrency)
+            try:
+                # A bounded window of submitted jobs, collected oldest first: the pool
+                # stays busy, output order follows prompt order, and prompts are not
+                # read further ahead than the window.
+                window = collections.deque()
+                for job in jobs:
+                    window.append(executor.submit(run, job))
+                    if len(window) >= 2 * max_concurrency:
+                        image_data.extend(window.popleft().result())
+                while window:
+                    image_data.extend(window.popleft().result())
+            finally:
+                # don't keep paying for requests after a failure
+                executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            for job in jobs:
+                image_data.extend(run(job))
 
-                # Convert to torch tensor
-                image_tensor = torch.from_numpy(image_np)
+        if not image_data:
+            raise ValueError("No prompts to generate images for.")
+        with timed("decode"):
+            return _decode_images(image_data)
 
-                images.append(image_tensor)
 
-        batched_images = torch.cat(images, dim=0)
-        return (batched_images,)
+def _generate_image_data(client, model, styled_prompt, n, size):
+    # retries are done by the shared rate limiter, not by the SDK
+    response = get_rate_limiter().call(
+        model,
+        lambda: client.with_options(max_retries=0).images.with_raw_response.generate(
+            model=model,
+            prompt=styled_prompt,
+            n=n,
+            size=size,
+            response_format="b64_json"
+        )
+    )
+
+    print(f"Successfully generated image for prompt: {styled_prompt}")
+
+    image_data = []
+    for img in response.data:
+        if not img.b64_json:
+            raise Exception("No image data returned from OpenAI API")
+        image_data.append(base64.b64decode(img.b64_json))
+    return image_data
+
+
+def _decode_images(image_data):
+    # Read only the headers first so the whole batch can be allocated once and
+    # each image decoded straight into its slot.
+    sizes = []
+    for image_bytes in image_data:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            sizes.append(img.size)
+
+    width = max(w for w, _ in sizes)
+    height = max(h for _, h in sizes)
+    if len(set(sizes)) > 1:
+        # Images of different sizes cannot share a batch, so smaller ones are
+        # padded (top-left aligned) and the padding is marked in the mask.
+        print(f"Generated images have mixed sizes {sorted(set(sizes))}, padding to {width}x{height}")
+
+    images = torch.zeros((len(image_data), height, width, 3), dtype=torch.float32)
+    alpha = torch.zeros((len(image_data), height, width), dtype=torch.float32)
+
+    for i, (image_bytes, (w, h)) in enumerate(zip(image_data, sizes)):
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            if "A" in img.getbands() or "transparency" in img.info:
+                # gpt-image-1 returns RGBA for transparent backgrounds
+                rgba = img if img.mode == "RGBA" else img.convert("RGBA")
+                pixels = torch.from_numpy(np.array(rgba))
+                images[i, :h, :w].copy_(pixels[..., :3])
+                alpha[i, :h, :w].copy_(pixels[..., 3])
+            else:
+                rgb = img if img.mode == "RGB" else img.convert("RGB")
+                pixels = torch.from_numpy(np.array(rgb))
+                images[i, :h, :w].copy_(pixels)
+                alpha[i, :h, :w] = 255.0
+            del pixels
+
+    images.div_(255.0)
+    # Same convention as LoadImage: mask = 1 - alpha
+    masks = alpha.div_(255.0).neg_().add_(1.0)
+    return (images, masks)
 
 
 def build_styled_prompt(style_indication: str, prompt: str):
@@ -127,6 +331,76 @@ def build_styled_prompt(style_indication: str, prompt: str):
         f"# Description of generated image\n{prompt}"
 
 
+# Largest side / shortest side the API keeps for each detail tier. Anything
+# bigger is downscaled server-side anyway, so sending it only costs bytes.
+VISION_DETAIL_LIMITS = {
+    "low": (512, None),
+    "high": (2048, 768),
+    "auto": (2048, 768),
+}
+
+PACKED_IMAGES_INSTRUCTION = (
+    "You are given {count} images. Follow the instructions above for each image separately. "
+    'Respond with a JSON object of the form {{"descriptions": ["...", ...]}} containing exactly '
+    "{count} strings, one per image, in the order the images were given."
+)
+
+
+def encode_vision_image(pixels, detail="auto", image_format="jpeg", quality=75):
+    with timed("vision_encode", format=image_format, detail=detail):
+        img = Image.fromarray(pixels)
+
+        # Downscale to the detail tier before encoding
+        max_side, max_short_side = VISION_DETAIL_LIMITS[detail]
+        w, h = img.size
+        scale = min(1.0, max_side / max(w, h))
+        if max_short_side is not None:
+            scale = min(scale, max_short_side / min(w, h))
+        if scale < 1.0:
+            img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.LANCZOS, reducing_gap=3.0)
+
+        # Convert image to base64
+        buffered = io.BytesIO()
+        img.save(buffered, format=image_format.upper(), quality=quality)
+    count("bytes_encoded", buffered.tell(), format=image_format)
+    base64_image = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    return f"data:image/{image_format};base64,{base64_image}"
+
+
+def build_description_request(prompt, pixel_list, detail="auto", image_format="jpeg", quality=75):
+    content = [{"type": "text", "text": prompt}]
+    params = {}
+    if len(pixel_list) > 1:
+        # several images in one request, one description per image back as JSON
+        content.append({"type": "text", "text": PACKED_IMAGES_INSTRUCTION.format(count=len(pixel_list))})
+        params["response_format"] = {"type": "json_object"}
+
+    for pixels in pixel_list:
+        content.append({"type": "image_url", "image_url": {
+            "url": encode_vision_image(pixels, detail, image_format, quality),
+            "detail": detail,
+            }
+        })
+
+    messages = [
+        # {"role": "system", "content": ""},
+        {"role": "user", "content": content},
+    ]
+    return messages, params
+
+
+def split_descriptions(msg, count):
+    if count == 1:
+        return [msg]
+    try:
+        descriptions = json.loads(msg)["descriptions"]
+    except (ValueError, KeyError, TypeError):
+        raise Exception(f"Could not parse the descriptions of {count} packed images: {msg[:200]}")
+    if not isinstance(descriptions, list) or len(descriptions) != count:
+        raise Exception(f"Expected {count} descriptions for the packed images, got: {msg[:200]}")
+    return [str(d) for d in descriptions]
+
+
 class OpenAIImageDescriptionToTextfile:
     def __init__(self):
         self.output_dir = folder_paths.get_output_directory()
@@ -148,11 +422,69 @@ class OpenAIImageDescriptionToTextfile:
                     {
                         "default": 2,
                         "min": 1,
-                        "max": 1000,
+                        "max": 1048576,
                         "step": 1,
                         "tooltip": "Excel cell row number."
                     }
                 ),
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": False, "tooltip": "Reuse locally cached descriptions for identical images and prompts."}),
+                "batch_mode": ("BOOLEAN", {"default": False, "tooltip": "Submit all requests as one OpenAI Batch API job (lower cost, completes within 24h)."}),
+                "batch_poll_interval": (
+                    "INT",
+                    {
+                        "default": 30,
+                        "min": 1,
+                        "max": 3600,
+                        "step": 1,
+                        "tooltip": "Seconds between batch status checks."
+                    }
+                ),
+                "detail": (["auto", "low", "high"], {"default": "auto", "tooltip": "Vision detail level. Images are downscaled to this tier before upload."}),
+                "image_format": (["jpeg", "webp"], {"default": "jpeg"}),
+                "quality": (
+                    "INT",
+                    {
+                        "default": 75,
+                        "min": 1,
+                        "max": 100,
+                        "step": 1,
+                        "tooltip": "JPEG/WebP quality of the uploaded images."
+                    }
+                ),
+                "images_per_request": (
+                    "INT",
+                    {
+                        "default": 1,
+                        "min": 1,
+                        "max": 16,
+                        "step": 1,
+                        "tooltip": "Pack several images into one request and get one description per image back."
+                    }
+                ),
+                "max_concurrent_requests": (
+                    "INT",
+                    {
+                        "default": 1,
+                        "min": 1,
+                        "max": 64,
+                        "step": 1,
+                        "tooltip": "Number of description requests in flight at once. Output files and rows keep the image order."
+                    }
+                ),
+                "excel_output": (EXCEL_OUTPUTS, {"default": "xlsx", "tooltip": "xlsx writes into the workbook. csv/parquet write a sidecar file next to it, for very large runs."}),
+                "flush_every": (
+                    "INT",
+                    {
+                        "default": 1000,
+                        "min": 1,
+                        "max": 100000,
+                        "step": 1,
+                        "tooltip": "Number of rows between saves of the Excel/Parquet output. xlsx rewrites the whole workbook on each save (at most once a minute); use csv or parquet for large runs."
+                    }
+                ),
+                "run_id": ("STRING", {"default": "", "multiline": False, "tooltip": "Journal completed descriptions under this ID. Rerunning with the same ID skips the images already described."}),
             }
         }
 
@@ -162,62 +494,151 @@ class OpenAIImageDescriptionToTextfile:
     OUTPUT_NODE = True
 
     def images_description_to_textfile(self, images, prompt, save_textfile, filename_prefix, 
-                                       save_excel, excel_path, sheet_name, column, start_row_num):
+                                       save_excel, excel_path, sheet_name, column, start_row_num,
+                                       use_cache=False, batch_mode=False, batch_poll_interval=30,
+                                       excel_output="xlsx", flush_every=1000, detail="auto", image_format="jpeg",
+                                       quality=75, images_per_request=1, max_concurrent_requests=1, run_id=""):
+        if save_excel and not excel_path:
+            raise ValueError("Excel path must be provided when save_excel is True.")
+
         client = create_openai_client()
+        cache = get_response_cache() if use_cache else None
 
         filename_prefix = self.apply_date_format(filename_prefix.strip())
         full_path = os.path.join(self.output_dir, filename_prefix)
 
-        messages = []
-
-        for index, image in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-
-            # Convert image to base64
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG")
-            base64_image = base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-
-            response = client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    # {"role": "system", "content": ""},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        },
-                    ]},
-                ]
-            )
-            msg = response.choices[0].message.content
-            messages.append(msg)
-
-            if save_textfile:
-                full_file_path = f"{full_path}_{index:04}.txt"
-                os.makedirs(os.path.dirname(full_file_path), exist_ok=True)
+        writer = None
+        if save_excel:
+            writer = open_result_writer(excel_output, excel_path, sheet_name, column, start_row_num, flush_every)
+
+        pixels = images_to_uint8(images)
+        remaining = list(range(len(pixels)))
+
+        journal = None
+        keys = None
+        if run_id.strip():
+            journal = open_run_journal("descriptions", run_id)
+            # the image content and request settings are part of the key, so a changed input is described again
+            keys = [
+                item_key(i, hashlib.sha256(pixels[i]).hexdigest(), prompt, detail, image_format, quality)
+                for i in range(len(pixels))
+            ]
+            remaining = [i for i in remaining if journal.get(keys[i]) is None]
+            self.replay_completed(journal, keys, full_path, save_textfile, writer, excel_output)
+
+        groups = [remaining[start:start + images_per_request] for start in range(0, len(remaining), images_per_request)]
+
+        def build_request(group):
+            return build_description_request(prompt, [pixels[i] for i in group], detail, image_format, quality)
+
+        try:
+            if batch_mode:
+                group_messages, failed = self.describe_with_batch(client, cache, groups, build_request, batch_poll_interval)
+                for group, msg in zip(groups, group_messages):
+                    if msg is None:
+                        continue
+                    for index, text in zip(group, split_descriptions(msg, len(group))):
+                        self.save_result(full_path, index, text, save_textfile, writer, journal, keys)
+                if failed:
+                    # the successful descriptions above are saved, cached and journaled; only these need a rerun
+                    failed_indexes = [index for n in failed for index in groups[n]]
+                    details = "; ".join(f"{groups[n]}: {error}" for n, error in list(failed.items())[:5])
+                    raise Exception(
+                        f"Batch returned no description for {len(failed_indexes)} of {len(remaining)} images "
+                        f"(indexes {failed_indexes[:20]}). {details}"
+                    )
+            else:
+                def describe(group):
+                    request_messages, params = build_request(group)
+                    msg = _create_chat_completion(client, cache, DESCRIPTION_MODEL, request_messages, **params)
+                    return split_descriptions(msg, len(group))
+
+                executor = None
+                if max_concurrent_requests > 1 and len(groups) > 1:
+                    # Encoding and requests run on the pool; results are consumed in
+                    # submission order, so files and rows are written while later
+                    # requests are still in flight and the order stays deterministic.
+                    executor = ThreadPoolExecutor(max_workers=min(max_concurrent_requests, len(groups)))
+                    results = executor.map(describe, groups)
+                else:
+                    results = map(describe, groups)
+
+                try:
+                    for group, texts in zip(groups, results):
+                        for index, text in zip(group, texts):
+                            self.save_result(full_path, index, text, save_textfile, writer, journal, keys)
+                finally:
+                    if executor is not None:
+                        # don't keep paying for requests after a failure
+                        executor.shutdown(wait=True, cancel_futures=True)
+        finally:
+            # also on failure, so rows finished so far are kept
+            if writer is not None:
+                writer.close()
 
-                with open(full_file_path, "w", encoding="utf-8") as f:
-                    f.write(msg)
-                    print(f"Saved description to {full_file_path}")
+        return {}, {}
 
-        if save_excel:
-            if not excel_path:
-                raise ValueError("Excel path must be provided when save_excel is True.")
+    def save_result(self, full_path, index, msg, save_textfile, writer, journal=None, keys=None):
+        if save_textfile:
+            self.save_textfile(full_path, index, msg)
+        if writer is not None:
+            writer.write(index, msg)
+        if journal is not None:
+            journal.record(keys[index], index=index, text=msg)
+
+    def replay_completed(self, journal, keys, full_path, save_textfile, writer, excel_output):
+        # Outputs of items finished by an earlier attempt may not have been saved
+        # (unflushed workbook rows, a parquet file that is rewritten per run), so
+        # they are written again from the journal. CSV rows were already appended.
+        for index, key in enumerate(keys):
+            done = journal.get(key)
+            if done is None:
+                continue
+            if save_textfile and not os.path.exists(f"{full_path}_{index:04}.txt"):
+                self.save_textfile(full_path, index, done["text"])
+            if writer is not None and excel_output != "csv":
+                writer.write(index, done["text"])
+
+    def describe_with_batch(self, client, cache, groups, build_request, poll_interval):
+        messages = [None] * len(groups)
+        pending = []
+        keys = {}
+
+        def bodies():
+            for n, group in enumerate(groups):
+                request_messages, params = build_request(group)
+                if cache is not None:
+                    key = make_cache_key("chat.completions", DESCRIPTION_MODEL, request_messages, **params)
+                    cached = cache.get_text(key)
+                    if cached is not None:
+                        messages[n] = cached
+                        continue
+                    keys[n] = key
+                pending.append(n)
+                yield {"model": DESCRIPTION_MODEL, "messages": request_messages, **params}
+
+        with timed("openai_batch"):
+            results, errors = run_chat_batch(
+                OpenAIBatchTransport(client), bodies(), folder_paths.get_temp_directory(), poll_interval=poll_interval
+            )
 
-            wb = load_workbook(excel_path, data_only=True)
-            ws = wb[sheet_name]
+        # results come back in submission order, i.e. the order of pending
+        for n, msg in zip(pending, results):
+            messages[n] = msg
+            if n in keys and msg is not None:
+                cache.put_text(keys[n], msg)
 
-            for i, msg in enumerate(messages):
-                cell = f"{column}{start_row_num + i}"
-                ws[cell] = msg
+        # group number -> error of the requests that failed
+        failed = {pending[i]: error for i, error in errors.items()}
+        return messages, failed
 
-            wb.save(excel_path)
+    def save_textfile(self, full_path, index, msg):
+        full_file_path = f"{full_path}_{index:04}.txt"
+        os.makedirs(os.path.dirname(full_file_path), exist_ok=True)
 
-        return {}, {}
+        with open(full_file_path, "w", encoding="utf-8") as f:
+            f.write(msg)
+            print(f"Saved description to {full_file_path}")
 
     def apply_date_format(self, text):
         if r"%date:" in text:
@@ -231,6 +652,9 @@ class OpenAIImageDescriptionToTextfile:
 class OpenAIChat:
     mdoels = ["gpt-4o", "gpt-4.1"]
 
+    def __init__(self):
+        self.last_metrics = {}
+
     @classmethod
     def INPUT_TYPES(cls):
         return {
@@ -238,7 +662,14 @@ class OpenAIChat:
                 "model": (cls.mdoels,),
                 "system_prompt": ("STRING", {"multiline": True, "tooltip": "System prompt to set the context for the chat."}),
                 "user_prompt": ("STRING", {"multiline": True, "tooltip": "Prompt to send to the OpenAI API."}),
-            }
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": False, "tooltip": "Reuse a locally cached reply for identical prompts."}),
+                "stream": ("BOOLEAN", {"default": False, "tooltip": "Stream the reply and show partial text on the node while it is generated."}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
     RETURN_TYPES = ("STRING",)
@@ -246,16 +677,121 @@ class OpenAIChat:
     FUNCTION = "chat"
     CATEGORY = "🐅cesilk_nodes"
 
-    def chat(self, model, system_prompt, user_prompt):
+    def chat(self, model, system_prompt, user_prompt, use_cache=False, stream=False, unique_id=None):
         client = create_openai_client()
+        cache = get_response_cache() if use_cache else None
 
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ]
+        self.last_metrics = {}
+        message = _create_chat_completion(client, cache, model, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ], on_text=_progress_text_sender(unique_id) if stream else None, metrics=self.last_metrics)
+
+        return (message,)
+
+
+def _progress_text_sender(node_id, min_interval=0.1):
+    try:
+        from server import PromptServer
+    except ImportError:
+        PromptServer = None
+    server = getattr(PromptServer, "instance", None)
+    if server is None or node_id is None or not hasattr(server, "send_progress_text"):
+        # Still stream (for the metrics) on ComfyUI versions without progress text
+        return lambda text, final=False: None
+
+    last_sent = 0.0
+
+    def send(text, final=False):
+        nonlocal last_sent
+        now = time.monotonic()
+        # Throttle websocket messages; the final text is always sent
+        if final or now - last_sent >= min_interval:
+            server.send_progress_text(text, node_id)
+            last_sent = now
+
+    return send
+
+
+def _create_chat_completion(client, cache, model, messages, on_text=None, metrics=None, **params):
+    if cache is not None:
+        key = make_cache_key("chat.completions", model, messages, **params)
+        cached = cache.get_text(key)
+        if cached is not None:
+            print(f"Using cached response for model: {model}")
+            return cached
+
+    if on_text is not None:
+        message = _stream_chat_completion(client, model, messages, on_text, metrics, **params)
+    else:
+        response = get_rate_limiter().call(
+            model,
+            lambda: client.with_options(max_retries=0).chat.completions.with_raw_response.create(
+                model=model, messages=messages, **params
+            ),
+            estimate_tokens(messages),
         )
         message = response.choices[0].message.content
 
-        return (message,)
+    if cache is not None and message is not None:
+        cache.put_text(key, message)
+    return message
+
+
+def _stream_chat_completion(client, model, messages, on_text, metrics=None, **params):
+    started = time.monotonic()
+    first_token_at = None
+    parts = []
+    chunk_count = 0
+    usage = None
+
+    stream = get_rate_limiter().call(
+        model,
+        lambda: client.with_options(max_retries=0).chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **params,
+        ),
+        estimate_tokens(messages),
+    )
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if first_token_at is None:
+            first_token_at = time.monotonic()
+        parts.append(delta)
+        chunk_count += 1
+        on_text("".join(parts))
+
+    finished = time.monotonic()
+    message = "".join(parts)
+    on_text(message, final=True)
+
+    # Without usage (e.g. some proxies) the number of content chunks is a close estimate
+    completion_tokens = usage.completion_tokens if usage is not None else chunk_count
+    ttft = (first_token_at or finished) - started
+    generation_time = finished - (first_token_at or finished)
+    tokens_per_sec = completion_tokens / generation_time if generation_time > 0 else 0.0
+
+    result = {
+        "model": model,
+        "time_to_first_token": ttft,
+        "total_time": finished - started,
+        "completion_tokens": completion_tokens,
+        "tokens_per_sec": tokens_per_sec,
+    }
+    if metrics is not None:
+        metrics.update(result)
+    observe("openai_time_to_first_token", ttft, model=model)
+    if usage is not None:
+        count("openai_tokens", usage.prompt_tokens, kind="input")
+    count("openai_tokens", completion_tokens, kind="output")
+    print(f"OpenAI stream {model}: ttft={ttft:.3f}s, {completion_tokens} tokens, {tokens_per_sec:.1f} tokens/s")
+    return message
@@ -0,0 +1,265 @@
+import os
+import random
+import re
+import threading
+import time
+
+from .metrics import count, timed
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at ``per_minute`` tokens per minute.
+
+    A rate of 0 means the limit is not known yet and acquire() never blocks,
+    until update() learns the real limit from the response headers.
+    """
+
+    def __init__(self, per_minute: float = 0):
+        self.per_minute = per_minute
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        while True:
+            with self._lock:
+                if self.per_minute <= 0:
+                    return
+                self._refill()
+                # a request bigger than the whole bucket still has to be allowed eventually
+                amount = min(amount, self.per_minute)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) * 60.0 / self.per_minute
+            time.sleep(min(wait, 1.0))
+
+    def update(self, limit=None, remaining=None):
+        with self._lock:
+            self._refill()
+            if limit is not None and limit > 0:
+                if self.per_minute <= 0:
+                    self.tokens = limit
+                self.per_minute = limit
+            if remaining is not None:
+                # the server's view wins when it has less left than we think
+                self.tokens = min(self.tokens, remaining)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.per_minute, self.tokens + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight requests: +1/limit per success (about +1 per
+    window of successful requests), halved when the API signals throttling.
+
+    A burst of 429s for requests that were already in flight is one congestion
+    signal, so the limit is halved at most once per window: only requests
+    started after the last decrease can decrease it again.
+    """
+
+    def __init__(self, initial: int = 16, minimum: int = 1, maximum: int = 64):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        # bumped on every decrease; acquire() hands out the current value
+        self._epoch = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return self._epoch
+
+    def release(self, throttled: bool = False, epoch: int = None):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                if epoch is None or epoch == self._epoch:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._epoch += 1
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+def _parse_duration(value):
+    # OpenAI reset headers look like "1s", "6m0s", "20ms" or "1h2m3.5s"
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total
+
+
+def _header_float(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages=None, max_output_tokens: int = 1000) -> int:
+    # Rough count for the TPM bucket: ~4 characters per token plus a flat cost per image
+    tokens = max_output_tokens
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                tokens += len(part.get("text", "")) // 4
+            elif part.get("type") == "image_url":
+                tokens += 85 if part["image_url"].get("detail") == "low" else 765
+    return tokens
+
+
+def _count_usage(result):
+    # chat completions report prompt/completion tokens, image generation input/output tokens;
+    # streams report usage in their last chunk and are counted by the caller
+    usage = getattr(result, "usage", None)
+    if usage is None:
+        return
+    count("openai_tokens", getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None) or 0, kind="input")
+    count("openai_tokens", getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None) or 0, kind="output")
+
+
+class _ModelLimits:
+    # request/token buckets and AIMD window of one model
+    def __init__(self, requests_per_minute, tokens_per_minute, max_concurrency):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(initial=max_concurrency, maximum=max(max_concurrency, 64))
+
+
+class RateLimiter:
+    """
+    Process-wide limiter shared by all OpenAI nodes.
+
+    OpenAI limits each model separately, so every model gets its own limits:
+    requests and tokens per minute are limited by token buckets whose rates
+    are learned from the x-ratelimit-* headers of that model's responses, and
+    in-flight requests by an AIMD window. 429s and transient errors are
+    retried with backoff, honouring retry-after.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 16, max_retries: int = 6):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._models = {}
+        self._models_lock = threading.Lock()
+
+    def limits(self, model: str) -> _ModelLimits:
+        with self._models_lock:
+            limits = self._models.get(model)
+            if limits is None:
+                limits = self._models[model] = _ModelLimits(
+                    self.requests_per_minute, self.tokens_per_minute, self.max_concurrency
+                )
+            return limits
+
+    def call(self, model: str, fn, estimated_tokens: int = 0):
+        """
+        Calls ``fn`` (which must return an openai raw response, i.e. a
+        ``.with_raw_response`` call) under the limits of ``model`` and returns
+        the parsed result.
+        """
+        import openai
+
+        limits = self.limits(model)
+        for attempt in range(self.max_retries + 1):
+            with timed("openai_rate_limit_wait", model=model):
+                limits.requests.acquire(1)
+                if estimated_tokens:
+                    limits.tokens.acquire(estimated_tokens)
+                epoch = limits.concurrency.acquire()
+
+            throttled = False
+            try:
+                with timed("openai_request", model=model):
+                    raw = fn()
+            except openai.RateLimitError as e:
+                throttled = True
+                error, delay = e, self._retry_after(e.response.headers, attempt)
+            except openai.APIStatusError as e:
+                if e.status_code < 500:
+                    raise
+                error, delay = e, self._backoff(attempt)
+            except (openai.APIConnectionError, openai.APITimeoutError) as e:
+                error, delay = e, self._backoff(attempt)
+            else:
+                throttled = self._observe(limits, raw.headers)
+                result = raw.parse()
+                _count_usage(result)
+                return result
+            finally:
+                limits.concurrency.release(throttled, epoch)
+
+            if attempt == self.max_retries:
+                raise error
+            count("openai_retries", reason=error.__class__.__name__)
+            print(f"OpenAI request to {model} failed ({error.__class__.__name__}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{self.max_retries}, concurrency limit {int(limits.concurrency.limit)})")
+            time.sleep(delay)
+
+    def _observe(self, limits, headers):
+        limit_requests = _header_float(headers, "x-ratelimit-limit-requests")
+        remaining_requests = _header_float(headers, "x-ratelimit-remaining-requests")
+        limits.requests.update(limit_requests, remaining_requests)
+        limits.tokens.update(
+            _header_float(headers, "x-ratelimit-limit-tokens"),
+            _header_float(headers, "x-ratelimit-remaining-tokens"),
+        )
+        # nearly out of requests for this window: back off before the API starts answering 429
+        return (
+            remaining_requests is not None
+            and remaining_requests <= limits.concurrency.in_flight
+        )
+
+    def _retry_after(self, headers, attempt):
+        retry_after_ms = _header_float(headers, "retry-after-ms")
+        if retry_after_ms is not None:
+            return retry_after_ms / 1000.0
+        retry_after = _header_float(headers, "retry-after")
+        if retry_after is not None:
+            return retry_after
+        reset = _parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if reset:
+            return reset + random.random()
+        return self._backoff(attempt)
+
+    def _backoff(self, attempt):
+        return min(60.0, 2 ** attempt) * (0.5 + random.random())
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                requests_per_minute=float(os.getenv("CESILK_OPENAI_RPM", 0)),
+                tokens_per_minute=float(os.getenv("CESILK_OPENAI_TPM", 0)),
+                max_concurrency=int(os.getenv("CESILK_OPENAI_MAX_CONCURRENCY", 16)),
+                max_retries=int(os.getenv("CESILK_OPENAI_RETRIES", 6)),
+            )
+        return _limiter
@@ -0,0 +1,46 @@
+import csv
+import itertools
+import os
+
+
+def iter_file_prompts(path, sheet_name="", column="A", start_row=1, offset=0, limit=0):
+    """
+    Yields non-empty prompts from one column of a CSV or Excel file, one at a
+    time, starting ``offset`` prompts after ``start_row`` and stopping after
+    ``limit`` prompts (0 = to the end).
+
+    Excel files are read with openpyxl's read-only mode and CSV files line by
+    line, so memory does not depend on the size of the file.
+    """
+    from openpyxl.utils import column_index_from_string
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Prompt file not found: {path}")
+
+    col = column_index_from_string(column.strip().upper())
+    if os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm"):
+        values = _iter_sheet_column(path, sheet_name, col, start_row)
+    else:
+        values = _iter_csv_column(path, col, start_row)
+
+    prompts = (str(value).strip() for value in values if value is not None and str(value).strip())
+    yield from itertools.islice(prompts, offset, offset + limit if limit else None)
+
+
+def _iter_sheet_column(path, sheet_name, col, start_row):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.active
+        for (value,) in ws.iter_rows(min_row=start_row, min_col=col, max_col=col, values_only=True):
+            yield value
+    finally:
+        # read-only workbooks keep the file open until closed
+        wb.close()
+
+
+def _iter_csv_column(path, col, start_row):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in itertools.islice(csv.reader(f), start_row - 1, None):
+            yield row[col - 1] if len(row) >= col else None
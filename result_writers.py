@@ -0,0 +1,147 @@
+import csv
+import os
+import time
+
+from .metrics import timed
+
+
+# every save rewrites the whole workbook, so xlsx is saved at most this often (seconds)
+EXCEL_MIN_FLUSH_INTERVAL = float(os.getenv("CESILK_EXCEL_FLUSH_INTERVAL", 60))
+
+class ExcelColumnWriter:
+    """
+    Writes results into one column of an existing workbook.
+
+    The workbook is saved every ``flush_every`` rows, but no more often than
+    every ``min_interval`` seconds, and on close, so rows finished before a
+    crash are kept. Each save rewrites the whole file; very large runs should
+    use a sidecar writer instead. It is loaded without ``data_only`` so
+    formulas elsewhere in the workbook survive the save.
+    """
+
+    def __init__(self, path, sheet_name, column, start_row, flush_every=1000,
+                 min_interval=EXCEL_MIN_FLUSH_INTERVAL):
+        from openpyxl import load_workbook
+
+        self.path = path
+        self.column = column
+        self.start_row = start_row
+        self.flush_every = max(1, flush_every)
+        self.min_interval = min_interval
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+        self._wb = load_workbook(path)
+        self._ws = self._wb[sheet_name]
+
+    def write(self, index, text):
+        self._ws[f"{self.column}{self.start_row + index}"] = text
+        self._pending += 1
+        if self._pending >= self.flush_every and time.monotonic() - self._flushed_at >= self.min_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending == 0:
+            return
+        # save next to the target and swap, so a crash mid-save never corrupts the workbook
+        root, ext = os.path.splitext(self.path)
+        tmp_path = f"{root}.tmp{ext}"
+        with timed("excel_flush"):
+            self._wb.save(tmp_path)
+            os.replace(tmp_path, self.path)
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._wb.close()
+
+
+class CsvSidecarWriter:
+    """
+    Appends results to a CSV file next to the workbook, one flushed line per
+    result. Memory stays flat regardless of how many rows the run produces.
+    """
+
+    FIELDS = ["sheet", "cell", "index", "text"]
+
+    def __init__(self, path, sheet_name, column, start_row):
+        self.path = path
+        self.sheet_name = sheet_name
+        self.column = column
+        self.start_row = start_row
+
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        if is_new:
+            self._writer.writerow(self.FIELDS)
+            self._file.flush()
+
+    def write(self, index, text):
+        self._writer.writerow([self.sheet_name, f"{self.column}{self.start_row + index}", index, text])
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSidecarWriter:
+    """
+    Writes results to a Parquet file next to the workbook, one row group per
+    ``flush_every`` results. The file is replaced on each run. Requires pyarrow.
+    """
+
+    def __init__(self, path, sheet_name, column, start_row, flush_every=1000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is required for the parquet output. Install it with: pip install pyarrow")
+
+        self._pa = pa
+        self.sheet_name = sheet_name
+        self.column = column
+        self.start_row = start_row
+        self.flush_every = max(1, flush_every)
+        self._rows = []
+
+        self._schema = pa.schema([
+            ("sheet", pa.string()),
+            ("cell", pa.string()),
+            ("index", pa.int64()),
+            ("text", pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, index, text):
+        self._rows.append((self.sheet_name, f"{self.column}{self.start_row + index}", index, text))
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = list(zip(*self._rows))
+        table = self._pa.Table.from_arrays([self._pa.array(c) for c in columns], schema=self._schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+EXCEL_OUTPUTS = ["xlsx", "csv", "parquet"]
+
+
+def open_result_writer(output, excel_path, sheet_name, column, start_row, flush_every=1000):
+    if output == "xlsx":
+        return ExcelColumnWriter(excel_path, sheet_name, column, start_row, flush_every)
+
+    sidecar_path = f"{os.path.splitext(excel_path)[0]}.{output}"
+    if output == "csv":
+        return CsvSidecarWriter(sidecar_path, sheet_name, column, start_row)
+    if output == "parquet":
+        return ParquetSidecarWriter(sidecar_path, sheet_name, column, start_row, flush_every)
+    raise ValueError(f"Unknown excel output '{output}'. Expected one of {EXCEL_OUTPUTS}.")
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from .jsonl_journal import append_record, read_records
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_journals")
+
+
+def item_key(*parts) -> str:
+    # identifies an item by its position and inputs, so a changed input list is not mistaken for the old one
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+class RunJournal:
+    """
+    Append-only JSONL journal of the completed items of one run.
+
+    Each finished item is appended (and fsynced) with its result or output
+    location, so a rerun with the same run ID can skip everything that was
+    already paid for. Output files that belong to the journal live in a
+    directory next to it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.output_dir = os.path.splitext(path)[0]
+        self._lock = threading.Lock()
+        self._completed = self._load()
+
+    def __len__(self):
+        return len(self._completed)
+
+    def get(self, item: str):
+        return self._completed.get(item)
+
+    def record(self, item: str, **fields):
+        record = {"item": item, **fields}
+        with self._lock:
+            append_record(self.path, record)
+            self._completed[item] = record
+
+    def write_output(self, item: str, number: int, data: bytes, extension: str = "png") -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{item}_{number:03}.{extension}")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def _load(self):
+        return {record["item"]: record for record in read_records(self.path)}
+
+
+def open_run_journal(kind: str, run_id: str) -> RunJournal:
+    directory = os.getenv("CESILK_RUN_JOURNAL_DIR") or DEFAULT_JOURNAL_DIR
+    os.makedirs(directory, exist_ok=True)
+    safe_id = re.sub(r"[^\w.-]", "_", run_id.strip())
+    journal = RunJournal(os.path.join(directory, f"{kind}-{safe_id}.jsonl"))
+    if len(journal):
+        print(f"Resuming run '{run_id}': {len(journal)} items already completed ({journal.path})")
+    return journal
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from .image_sinks import PNG_CONTENT_TYPE, upload_bytes_to_s3
+from .metrics import count
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "s3_dedup_index.sqlite3")
+
+DEDUP_MODES = ["off", "skip", "copy"]
+
+
+class DedupIndex:
+    """
+    Local SQLite index of uploaded objects: content sha256 -> bucket/key/ETag.
+
+    The index is only a hint. reconcile() drops entries whose object is gone
+    or has changed in the bucket, and copy mode falls back to a normal upload
+    when the indexed source object no longer exists.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " bucket TEXT NOT NULL, key TEXT NOT NULL, sha256 TEXT NOT NULL,"
+            " etag TEXT, size INTEGER NOT NULL, updated REAL NOT NULL,"
+            " PRIMARY KEY (bucket, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS objects_sha256 ON objects (sha256, bucket)")
+
+    def lookup(self, sha256, bucket, key=None):
+        # prefer the object at the target key itself, then the most recent copy
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key, etag FROM objects WHERE sha256 = ? AND bucket = ? "
+                "ORDER BY key = ? DESC, updated DESC LIMIT 1",
+                (sha256, bucket, key),
+            ).fetchone()
+        return row
+
+    def record(self, sha256, bucket, key, etag, size):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO objects (bucket, key, sha256, etag, size, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (bucket, key, sha256, etag, size, time.time()),
+            )
+
+    def forget(self, bucket, key):
+        with self._lock:
+            self._db.execute("DELETE FROM objects WHERE bucket = ? AND key = ?", (bucket, key))
+
+    def reconcile(self, client, bucket, prefix=""):
+        """
+        Compares the entries under ``prefix`` with a bucket listing and drops
+        those whose object was deleted or no longer matches (size or ETag).
+        Returns (kept, removed).
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, etag, size FROM objects WHERE bucket = ? AND key >= ? AND key < ?",
+                (bucket, prefix, prefix + "\U0010ffff"),
+            ).fetchall()
+        if not rows:
+            return 0, 0
+
+        listed = {}
+        paginator = client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                listed[obj["Key"]] = (obj.get("ETag"), obj.get("Size"))
+
+        stale = [
+            key for key, etag, size in rows
+            if key not in listed or listed[key][1] != size or (etag and listed[key][0] != etag)
+        ]
+        with self._lock:
+            self._db.executemany("DELETE FROM objects WHERE bucket = ? AND key = ?", [(bucket, key) for key in stale])
+        print(f"S3 dedup index reconciled with s3://{bucket}/{prefix}: {len(rows) - len(stale)} kept, {len(stale)} removed")
+        return len(rows) - len(stale), len(stale)
+
+
+def content_sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def single_part_etag(data: bytes) -> str:
+    # ETag S3 returns for a plain PutObject without SSE-KMS; multipart ETags differ
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def copy_indexed_object(client, index, bucket, source_key, key):
+    """Server-side copy of an indexed object. Returns the new ETag, or None when the source is gone."""
+    from botocore.exceptions import ClientError
+
+    try:
+        response = client.copy_object(Bucket=bucket, Key=key, CopySource={"Bucket": bucket, "Key": source_key})
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            index.forget(bucket, source_key)
+            return None
+        raise
+    return response.get("CopyObjectResult", {}).get("ETag")
+
+
+def reuse_indexed_object(client, index, mode, sha256, bucket, key, size) -> bool:
+    """
+    Returns True when ``key`` needs no upload because the index knows identical
+    content: mode "skip" leaves it out entirely, "copy" creates ``key`` with a
+    server-side copy of the existing object instead of sending the bytes again.
+    """
+    existing = index.lookup(sha256, bucket, key)
+    if existing is None:
+        return False
+    source_key, _ = existing
+    if source_key == key or mode == "skip":
+        print(f"skip S3 upload, identical content already at s3://{bucket}/{source_key}")
+        count("s3_dedup", result="skip")
+        return True
+    etag = copy_indexed_object(client, index, bucket, source_key, key)
+    if not etag:
+        return False
+    index.record(sha256, bucket, key, etag, size)
+    print(f"copied identical object s3://{bucket}/{source_key} to {key}")
+    count("s3_dedup", result="copy")
+    return True
+
+
+def upload_bytes_deduplicated(client, index, mode, data: bytes, bucket: str, key: str, transfer_config=None,
+                              content_type: str = PNG_CONTENT_TYPE):
+    sha256 = content_sha256(data)
+    if reuse_indexed_object(client, index, mode, sha256, bucket, key, len(data)):
+        return
+
+    upload_bytes_to_s3(client, data, bucket, key, transfer_config, content_type, metadata={"sha256": sha256})
+    count("s3_dedup", result="upload")
+    threshold = getattr(transfer_config, "multipart_threshold", 8 * 1024 * 1024)
+    if len(data) < threshold:
+        etag = single_part_etag(data)
+    else:
+        etag = client.head_object(Bucket=bucket, Key=key).get("ETag")
+    index.record(sha256, bucket, key, etag, len(data))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_dedup_index() -> DedupIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DedupIndex(os.getenv("CESILK_S3_DEDUP_INDEX") or DEFAULT_INDEX_PATH)
+        return _index
@@ -0,0 +1,196 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from .jsonl_journal import append_record, read_records
+from .metrics import count, timed
+
+
+MB = 1024 * 1024
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "s3_upload_journal.jsonl")
+
+
+def transfer_config_from_env():
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=int(float(os.getenv("CESILK_S3_MULTIPART_THRESHOLD_MB", 8)) * MB),
+        multipart_chunksize=int(float(os.getenv("CESILK_S3_MULTIPART_CHUNKSIZE_MB", 8)) * MB),
+        max_concurrency=int(os.getenv("CESILK_S3_MAX_CONCURRENCY", 10)),
+        use_threads=True,
+    )
+
+
+class UploadJournal:
+    """
+    Append-only JSONL journal of queued uploads.
+
+    A "queued" record is written before an upload is handed to a worker and a
+    "done" record once it has finished, so anything queued but not done was
+    interrupted or failed and can be retried on the next start.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record_queued(self, job: dict):
+        self._append({"op": "queued", **job})
+
+    def record_done(self, job_id: str):
+        self._append({"op": "done", "id": job_id})
+
+    def pending(self):
+        jobs = {}
+        with self._lock:
+            for record in read_records(self.path):
+                op = record.pop("op", None)
+                if op == "queued":
+                    jobs[record["id"]] = record
+                elif op == "done":
+                    jobs.pop(record["id"], None)
+        return list(jobs.values())
+
+    def compact(self, jobs):
+        # Rewrite the journal with only the still pending jobs so it does not grow forever
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for job in jobs:
+                    f.write(json.dumps({"op": "queued", **job}) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def _append(self, record: dict):
+        with self._lock:
+            append_record(self.path, record)
+
+
+class S3UploadQueue:
+    """
+    Bounded pool of background workers uploading local files to S3.
+
+    submit() blocks once max_pending uploads are waiting, which keeps memory
+    and disk backlog bounded when uploads are slower than rendering.
+    """
+
+    def __init__(self, client, workers: int = 4, max_pending: int = 64, journal: UploadJournal = None,
+                 transfer_config=None, max_attempts: int = 5):
+        self.client = client
+        self.journal = journal
+        self.transfer_config = transfer_config or transfer_config_from_env()
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue(maxsize=max_pending)
+
+        pending = []
+        if self.journal is not None:
+            pending = self.journal.pending()
+            self.journal.compact(pending)
+
+        for n in range(workers):
+            threading.Thread(target=self._worker, name=f"cesilk-s3-upload-{n}", daemon=True).start()
+
+        if pending:
+            print(f"Resuming {len(pending)} unfinished S3 uploads from {self.journal.path}")
+            # Re-queued from a separate thread so a long backlog does not block the caller
+            threading.Thread(target=self._requeue, args=(pending,), daemon=True).start()
+
+    def submit(self, path: str, bucket: str, key: str, sha256: str = None, content_type: str = None):
+        job = {"id": uuid.uuid4().hex, "path": path, "bucket": bucket, "key": key}
+        if content_type is not None:
+            job["content_type"] = content_type
+        if sha256 is not None:
+            # recorded in the dedup index once the upload is done
+            job["sha256"] = sha256
+        if self.journal is not None:
+            self.journal.record_queued(job)
+        self._queue.put(job)
+
+    def wait(self):
+        self._queue.join()
+
+    def _requeue(self, jobs):
+        for job in jobs:
+            self._queue.put(job)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._upload(job)
+            finally:
+                self._queue.task_done()
+
+    def _upload(self, job: dict):
+        if not os.path.exists(job["path"]):
+            print(f"Skip S3 upload, file no longer exists: {job['path']}")
+            self._mark_done(job)
+            return
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                extra_args = {}
+                if job.get("content_type"):
+                    extra_args["ContentType"] = job["content_type"]
+                if job.get("sha256"):
+                    extra_args["Metadata"] = {"sha256": job["sha256"]}
+                with timed("upload", sink="s3_queue"):
+                    self.client.upload_file(job["path"], job["bucket"], job["key"],
+                                            ExtraArgs=extra_args or None, Config=self.transfer_config)
+            except Exception as e:
+                print(f"S3 upload failed (attempt {attempt}/{self.max_attempts}): {job['key']}: {e}")
+                if attempt < self.max_attempts:
+                    count("upload_retries", sink="s3_queue")
+                    time.sleep(min(2 ** attempt, 60))
+                continue
+            print(f"upload image success. S3 Key: {job['key']}")
+            count("bytes_uploaded", os.path.getsize(job["path"]), sink="s3_queue")
+            if job.get("sha256"):
+                self._record_dedup(job)
+            self._mark_done(job)
+            return
+
+        # Left as "queued" in the journal so it is retried after a restart
+        print(f"Giving up on S3 upload until restart: {job['key']}")
+
+    def _record_dedup(self, job: dict):
+        from .s3_dedup import get_dedup_index
+
+        try:
+            head = self.client.head_object(Bucket=job["bucket"], Key=job["key"])
+            get_dedup_index().record(job["sha256"], job["bucket"], job["key"], head.get("ETag"), head["ContentLength"])
+        except Exception as e:
+            # the object is uploaded either way; it is just not known to the index
+            print(f"Could not record {job['key']} in the S3 dedup index: {e}")
+
+    def _mark_done(self, job: dict):
+        if self.journal is not None:
+            self.journal.record_done(job["id"])
+
+
+_upload_queue = None
+_upload_queue_lock = threading.Lock()
+
+
+def _journal_path() -> str:
+    return os.getenv("CESILK_S3_UPLOAD_JOURNAL") or DEFAULT_JOURNAL_PATH
+
+
+def has_pending_uploads() -> bool:
+    # only reads the journal, so it can run at startup without importing boto3
+    return bool(UploadJournal(_journal_path()).pending())
+
+
+def get_upload_queue(client) -> S3UploadQueue:
+    global _upload_queue
+    with _upload_queue_lock:
+        if _upload_queue is None:
+            _upload_queue = S3UploadQueue(
+                client,
+                workers=int(os.getenv("CESILK_S3_UPLOAD_WORKERS", 4)),
+                max_pending=int(os.getenv("CESILK_S3_UPLOAD_QUEUE_SIZE", 64)),
+                journal=UploadJournal(_journal_path()),
+            )
+        return _upload_queue
@@ -0,0 +1,131 @@
+import os
+import time
+import uuid
+
+from PIL import Image
+
+import folder_paths
+try:
+    from comfy.cli_args import args
+except Exception:
+    class _A: disable_metadata = False
+    args = _A()
+
+from .image_utils import images_to_uint8
+from .image_sinks import (
+    ENCODE_INPUTS, OUTPUT_FORMATS, SinkFanout, build_image_metadata, encode_image, map_ordered,
+    resolve_encode_workers, upload_bytes_to_s3, write_file,
+)
+from .s3_dedup import DEDUP_MODES, get_dedup_index, upload_bytes_deduplicated
+from .s3_upload_queue import transfer_config_from_env
+from .save_and_upload_to_gdrive import NODE_CATEGORY, _ensure_auth, _upload_bytes, replace_datetime_placeholders
+from .save_upload_s3 import current_jst_date, get_s3_client
+
+
+class SaveAndUploadToSinks:
+    """
+    Encodes each image once and sends the same in-memory file to local disk,
+    S3 and Google Drive concurrently.
+    """
+
+    def __init__(self):
+        self.output_dir = folder_paths.get_output_directory()
+        self.type = "output"
+
+        self._node_dir = os.path.dirname(os.path.abspath(__file__))
+        self.root_id = os.getenv("GDRIVE_ROOT_ID")
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "images": ("IMAGE", {"tooltip": "The images to save."}),
+                "filename_prefix": ("STRING", {"default": "%year%-%month%-%day%/%hour%%minute%%second%", "tooltip": "The prefix for the file to save. When save_local is off, a run timestamp is added to the uploaded names so runs never overwrite each other."}),
+                "save_local": ("BOOLEAN", {"default": True, "tooltip": "Also write the images to the ComfyUI output directory."}),
+                "s3_upload": ("BOOLEAN", {"default": False}),
+                "s3_bucket": ("STRING", {"default": "sd-image-88"}),
+                "s3_path": ("STRING", {"default": ""}),
+                "gdrive_upload": ("BOOLEAN", {"default": False}),
+                "gdrive_directory": ("STRING", {"default": "@@%Y-%m-%d@@"}),
+            },
+            "optional": {
+                **ENCODE_INPUTS,
+                "s3_dedup": (DEDUP_MODES, {"default": "off", "tooltip": "Look up identical images in the local S3 dedup index. skip: don't upload them again. copy: create the new key with a server-side copy."}),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "extra_pnginfo": "EXTRA_PNGINFO"
+            },
+        }
+
+    RETURN_TYPES = ()
+    FUNCTION = "save_and_upload"
+    CATEGORY = NODE_CATEGORY
+    OUTPUT_NODE = True
+
+    def save_and_upload(self, images, filename_prefix, save_local, s3_upload, s3_bucket, s3_path,
+                        gdrive_upload, gdrive_directory, encode_workers=0, output_format="png", compress_level=4, quality=90,
+                        s3_dedup="off", prompt=None, extra_pnginfo=None):
+        if images is None or len(images) == 0:
+            return {"ui": {"images": []}}
+
+        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(
+            filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0]
+        )
+        # The counter comes from the files in the output folder, so without a local
+        # copy it restarts at 1 every run; make the uploaded names unique per run.
+        run_tag = "" if save_local else f"_{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+        s3 = None
+        if s3_upload:
+            s3 = get_s3_client()
+            if not s3_path:
+                s3_path = f"outputs/{current_jst_date()}/"
+        transfer_config = transfer_config_from_env()
+        dedup_index = get_dedup_index() if s3_upload and s3_dedup != "off" else None
+
+        service = None
+        if gdrive_upload:
+            gdrive_directory = replace_datetime_placeholders(gdrive_directory)
+            service = _ensure_auth(self._node_dir)
+
+        results = []
+
+        extension, content_type = OUTPUT_FORMATS[output_format]
+        pixels = images_to_uint8(images)
+        metadata = None
+        if not getattr(args, "disable_metadata", False):
+            metadata = build_image_metadata(output_format, prompt, extra_pnginfo)
+
+        def encode(batch_number):
+            img = Image.fromarray(pixels[batch_number])
+            # encode once; every sink gets the same buffer
+            return encode_image(img, output_format, metadata, compress_level, quality)
+
+        workers = resolve_encode_workers(encode_workers, len(images))
+        with SinkFanout() as fanout:
+            for batch_number, data in enumerate(map_ordered(encode, range(len(images)), workers)):
+                filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
+                file = f"{filename_with_batch_num}{run_tag}_{counter:05}_.{extension}"
+                counter += 1
+
+                if save_local:
+                    fanout.submit(write_file, os.path.join(full_output_folder, file), data)
+                    results.append({
+                        "filename": file,
+                        "subfolder": subfolder,
+                        "type": self.type
+                    })
+
+                if s3_upload:
+                    if dedup_index is not None:
+                        fanout.submit(upload_bytes_deduplicated, s3, dedup_index, s3_dedup, data, s3_bucket,
+                                      os.path.join(s3_path, file), transfer_config, content_type)
+                    else:
+                        fanout.submit(upload_bytes_to_s3, s3, data, s3_bucket, os.path.join(s3_path, file), transfer_config,
+                                      content_type)
+
+                if gdrive_upload:
+                    fanout.submit(_upload_bytes, service, self.root_id, gdrive_directory, file, data, content_type)
+
+        return {"ui": {"images": results}}
@@ -1,11 +1,13 @@
+import hashlib
+import io
 import json
 import os
 import re
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 
-import numpy as np
 from PIL import Image
-from PIL.PngImagePlugin import PngInfo
 
 import folder_paths
 try:
@@ -14,13 +16,14 @@ except Exception:
     class _A: disable_metadata = False
     args = _A()
 
-import google.auth
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+# google-auth / googleapiclient は初回実行時に import する (ComfyUI の起動を遅くしないため)
+
+from .image_utils import images_to_uint8
+from .image_sinks import (
+    ENCODE_INPUTS, OUTPUT_FORMATS, SinkFanout, build_image_metadata, encode_image, map_ordered,
+    resolve_encode_workers, write_file,
+)
+from .metrics import count, timed
 
 
 NODE_CATEGORY = "🐅cesilk_nodes"
@@ -52,7 +55,11 @@ def replace_datetime_placeholders(text: str) -> str:
     return re.sub(r"@@(.*?)@@", repl, text)
 
 
-def _ensure_auth(node_dir):
+def _load_credentials(node_dir):
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     creds = None
     token_path = os.path.join(node_dir, "token.json")
     credentials_path = os.path.join(node_dir, "credentials.json")
@@ -67,76 +74,333 @@ def _ensure_auth(node_dir):
                 credentials_path, SCOPES
             )
             creds = flow.run_local_server(port=0)
-        with open(token_path, "w") as token:
-            token.write(creds.to_json())
+        _save_token(node_dir, creds)
 
-    service = build("drive", "v3", credentials=creds)
-    return service
+    return creds
 
 
-def _upload_file(service, root_id, sub_id, filename):
-    try:
-        # search folder
-        files = []
-        page_token = None
-        while True:
-            q = (
-                f"'{root_id}' in parents and "
-                f"mimeType = 'application/vnd.google-apps.folder' and "
-                f"name = '{sub_id}' and trashed = false"
-            )
+def _save_token(node_dir, creds):
+    with open(os.path.join(node_dir, "token.json"), "w") as token:
+        token.write(creds.to_json())
+
+
+# node_dir -> (credentials, Drive service)
+# discovery の build と token.json の読込はプロセスで一度だけ行う
+_services = {}
+_services_lock = threading.Lock()
+# id(service) -> credentials, for the per-thread HTTP objects below
+_service_credentials = {}
+_thread_state = threading.local()
+
+GDRIVE_API_ENDPOINT = os.getenv("CESILK_GDRIVE_API_ENDPOINT")
+UPLOAD_CHUNK_SIZE = int(float(os.getenv("CESILK_GDRIVE_CHUNK_SIZE_MB", 8)) * 1024 * 1024)
+UPLOAD_RETRIES = int(os.getenv("CESILK_GDRIVE_RETRIES", 5))
+UPLOAD_SESSIONS_PATH = os.getenv("CESILK_GDRIVE_UPLOAD_SESSIONS") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "gdrive_upload_sessions.json"
+)
+# Drive keeps a resumable session for one week; stay a little under that
+UPLOAD_SESSION_MAX_AGE = 6 * 24 * 3600
+
+
+def _ensure_auth(node_dir):
+    from google.auth.transport.requests import Request
+    from googleapiclient.discovery import build
+
+    with _services_lock:
+        cached = _services.get(node_dir)
+        if cached is not None:
+            creds, service = cached
+            if creds.valid:
+                return service
+            if creds.expired and creds.refresh_token:
+                # the service holds this same credentials object, so refreshing in place is enough
+                creds.refresh(Request())
+                _save_token(node_dir, creds)
+                return service
+
+        creds = _load_credentials(node_dir)
+        client_options = {"api_endpoint": GDRIVE_API_ENDPOINT} if GDRIVE_API_ENDPOINT else None
+        service = build("drive", "v3", credentials=creds, client_options=client_options)
+        _services[node_dir] = (creds, service)
+        _service_credentials[id(service)] = creds
+        return service
+
+
+def _http(service):
+    # httplib2.Http は thread-safe ではないので、スレッドごとに認証付き Http を持つ
+    creds = _service_credentials.get(id(service))
+    if creds is None:
+        return None
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+
+    http = getattr(_thread_state, "http", None)
+    if http is None or http.credentials is not creds:
+        http = AuthorizedHttp(creds, http=httplib2.Http())
+        _thread_state.http = http
+    return http
+
+
+class _UploadSessions:
+    """
+    Resumable upload session URIs persisted in a small JSON file, keyed by
+    folder, file name and content hash, so an interrupted upload of the same
+    file continues where it stopped, also after a restart.
+
+    Drive expires a session URI after a week; older entries are pruned
+    whenever the file is written. A session is handed to one upload at a time.
+    """
+
+    def __init__(self, path, max_age=UPLOAD_SESSION_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._active = set()
+
+    def claim(self, key):
+        # returns the saved URI (or None) and keeps concurrent uploads of the same content apart
+        with self._lock:
+            if key in self._active:
+                return None, False
+            self._active.add(key)
+            entry = self._load().get(key)
+            return (entry or {}).get("uri"), True
+
+    def release(self, key):
+        with self._lock:
+            self._active.discard(key)
+
+    def put(self, key, uri):
+        with self._lock:
+            sessions = self._load()
+            sessions[key] = {"uri": uri, "created": time.time()}
+            self._save(sessions)
+
+    def remove(self, key):
+        with self._lock:
+            sessions = self._load()
+            if sessions.pop(key, None) is not None:
+                self._save(sessions)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                sessions = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        cutoff = time.time() - self.max_age
+        return {
+            key: entry for key, entry in sessions.items()
+            if isinstance(entry, dict) and entry.get("created", 0) > cutoff
+        }
+
+    def _save(self, sessions):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sessions, f)
+        os.replace(tmp_path, self.path)
+
+
+_upload_sessions = _UploadSessions(UPLOAD_SESSIONS_PATH)
+
+
+FOLDER_CACHE_TTL = float(os.getenv("CESILK_GDRIVE_FOLDER_CACHE_TTL", 600))
+
+# (root_id, folder name) -> (folder id, cached at)
+_folder_ids = {}
+_folder_locks = {}
+_folder_locks_lock = threading.Lock()
+
+
+def _folder_lock(key):
+    with _folder_locks_lock:
+        lock = _folder_locks.get(key)
+        if lock is None:
+            lock = _folder_locks[key] = threading.Lock()
+        return lock
+
+
+def _cached_folder_id(key):
+    cached = _folder_ids.get(key)
+    if cached is not None and time.monotonic() - cached[1] < FOLDER_CACHE_TTL:
+        return cached[0]
+    return None
+
+
+def _invalidate_folder(root_id, sub_id):
+    _folder_ids.pop((root_id, sub_id), None)
+
+
+def _find_or_create_folder(service, root_id, sub_id):
+    key = (root_id, sub_id)
+    folder_id = _cached_folder_id(key)
+    if folder_id is not None:
+        return folder_id
+
+    # 同じフォルダを複数スレッドが同時に作成しないよう、フォルダ単位でロックする
+    with _folder_lock(key):
+        folder_id = _cached_folder_id(key)
+        if folder_id is None:
+            folder_id = _search_folder(service, root_id, sub_id)
+        if folder_id is None:
+            folder_id = _create_folder(service, root_id, sub_id)
+        _folder_ids[key] = (folder_id, time.monotonic())
+        return folder_id
+
+
+def _search_folder(service, root_id, sub_id):
+    # search folder
+    files = []
+    page_token = None
+    while True:
+        q = (
+            f"'{root_id}' in parents and "
+            f"mimeType = 'application/vnd.google-apps.folder' and "
+            f"name = '{sub_id}' and trashed = false"
+        )
+        with timed("gdrive_folder_lookup"):
             response = (
                 service.files()
                 .list(
                     q=q,
                     spaces="drive",
                     fields="nextPageToken, files(id, name)",
+                    # 他プロセスと同時に作成されて重複した場合も、全員が最も古いフォルダを選ぶ
+                    orderBy="createdTime",
                     pageToken=page_token,
                 )
-                .execute()
+                .execute(http=_http(service), num_retries=UPLOAD_RETRIES)
             )
-            files.extend(response.get("files", []))
-            page_token = response.get("nextPageToken", None)
-            if page_token is None:
-                break
-
-        if files:
-            target_folder_id = files[0].get("id", "")
-            print(f'Found file: {sub_id}, {target_folder_id}')
-        else:
+        files.extend(response.get("files", []))
+        page_token = response.get("nextPageToken", None)
+        if page_token is None:
+            break
+
+    if not files:
+        return None
+
+    target_folder_id = files[0].get("id", "")
+    print(f'Found file: {sub_id}, {target_folder_id}')
+    return target_folder_id
+
+
+def _create_folder(service, root_id, sub_id):
+    # create folder
+    folder_metadata = {
+        "name": sub_id,
+        "mimeType": "application/vnd.google-apps.folder",
+        "parents": [root_id],
+    }
+    folder = (
+        service.files()
+        .create(body=folder_metadata, fields="id")
+        .execute(http=_http(service), num_retries=UPLOAD_RETRIES)
+    )
+    target_folder_id = folder.get("id")
+    print(f'target_folder_id: "{target_folder_id}".')
+
+    # another process may have created the same folder at the same time
+    return _search_folder(service, root_id, sub_id) or target_folder_id
+
+
+def _endpoint_uri(uri):
+    # googleapiclient は api_endpoint のホストだけを upload URL に使い、スキームは https のまま残す
+    if not GDRIVE_API_ENDPOINT or not uri:
+        return uri
+    from urllib.parse import urlsplit
+
+    endpoint = urlsplit(GDRIVE_API_ENDPOINT)
+    return urlsplit(uri)._replace(scheme=endpoint.scheme, netloc=endpoint.netloc).geturl()
+
+
+def _upload_media(service, folder_id, name, media, session_key=None):
+    from googleapiclient.errors import HttpError
+
+    file_metadata = {"name": name, "parents": [folder_id]}
+    request = service.files().create(body=file_metadata, media_body=media, fields="id")
+    request.uri = _endpoint_uri(request.uri)
+    http = _http(service)
+
+    # the session carries the metadata it was created with, so the name must be part of the key:
+    # identical content uploaded under another name needs its own file
+    session_key = f"{folder_id}/{name}/{session_key}" if session_key else None
+    resumed_uri, claimed = _upload_sessions.claim(session_key) if session_key else (None, False)
+    if resumed_uri:
+        # ask the server how much it already has and continue from there.
+        # HttpRequest has no public way to resume a saved session; this relies on the
+        # resumable_uri / _in_error_state attributes of google-api-python-client 2.x.
+        request.resumable_uri = _endpoint_uri(resumed_uri)
+        request._in_error_state = True
+        print(f"Resuming upload of {name}")
+
+    file = None
+    try:
+        while file is None:
+            # next_chunk retries 429/5xx and dropped connections with exponential backoff
+            _, file = request.next_chunk(http=http, num_retries=UPLOAD_RETRIES)
+            if claimed and request.resumable_uri and request.resumable_uri != resumed_uri:
+                _upload_sessions.put(session_key, request.resumable_uri)
+                resumed_uri = request.resumable_uri
+        if claimed:
+            _upload_sessions.remove(session_key)
+    except HttpError as error:
+        if resumed_uri and error.resp.status in (404, 410):
+            # the saved session has expired; start a new one
+            _upload_sessions.remove(session_key)
+            _upload_sessions.release(session_key)
+            claimed = False
+            media.stream().seek(0)
+            return _upload_media(service, folder_id, name, media)
+        raise
+    finally:
+        if claimed:
+            _upload_sessions.release(session_key)
+
+    print(f'File ID: {file.get("id")}')
+    return file.get("id")
+
+
+def _upload_to_folder(service, root_id, sub_id, name, make_media, session_key=None):
+    from googleapiclient.errors import HttpError
+
+    # 429/5xx の再試行は next_chunk に任せ、ここではフォルダの再検索だけを行う
+    for attempt in range(2):
+        target_folder_id = _find_or_create_folder(service, root_id, sub_id)
+        try:
+            with timed("upload", sink="gdrive"):
+                return _upload_media(service, target_folder_id, name, make_media(), session_key)
+        except HttpError as error:
+            if error.resp.status == 404 and attempt == 0:
+                # キャッシュ済みのフォルダが削除されていた場合は検索し直して再試行
+                print(f"Folder {sub_id} ({target_folder_id}) not found, looking it up again")
+                _invalidate_folder(root_id, sub_id)
+                continue
+            raise
+
 
-            # create folder
-            folder_metadata = {
-                "name": sub_id,
-                "mimeType": "application/vnd.google-apps.folder",
-                "parents": [root_id],
-            }
-            folder = service.files().create(body=folder_metadata, fields="id").execute()
-            target_folder_id = folder.get("id")
-            print(f'target_folder_id: "{target_folder_id}".')
-
-        # file upload
-        file_metadata = {"name": os.path.basename(filename), "parents": [target_folder_id]}
-        media = MediaFileUpload(filename, mimetype="image/png", resumable=True)
-        file = (
-            service.files()
-            .create(body=file_metadata, media_body=media, fields="id")
-            .execute()
+def _upload_bytes(service, root_id, sub_id, name, data, mimetype="image/png"):
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaIoBaseUpload
+
+    # エンコード済みのメモリ上のバッファをそのまま送る (ディスクから再読込しない)
+    try:
+        file_id = _upload_to_folder(
+            service, root_id, sub_id, name,
+            lambda: MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=True),
+            session_key=hashlib.sha256(data).hexdigest(),
         )
-        print(f'File ID: {file.get("id")}')
+        count("bytes_uploaded", len(data), sink="gdrive")
+        return file_id
 
     except HttpError as error:
         print(f"An error occurred: {error}")
-        file = None
-
-    return file.get("id")
+        return None
 
 
 class SaveAndUploadToGoogleDrive:
     def __init__(self):
         self.output_dir = folder_paths.get_output_directory()
         self.type = "output"
-        self.compress_level = 4  # PNG 圧縮
 
         # 認証ファイル検索用にこの .py の場所を覚えておく
         self._node_dir = os.path.dirname(os.path.abspath(__file__))
@@ -151,6 +415,19 @@ class SaveAndUploadToGoogleDrive:
                 "directory": ("STRING", {"default": "@@%Y-%m-%d@@"}),
                 "filename_prefix": ("STRING", {"default": "@@%H%M%S@@"}),
             },
+            "optional": {
+                **ENCODE_INPUTS,
+                "upload_workers": (
+                    "INT",
+                    {
+                        "default": 4,
+                        "min": 1,
+                        "max": 16,
+                        "step": 1,
+                        "tooltip": "Number of concurrent Google Drive uploads."
+                    }
+                ),
+            },
             "hidden": {
                 "prompt": "PROMPT",
                 "extra_pnginfo": "EXTRA_PNGINFO"
@@ -163,6 +440,7 @@ class SaveAndUploadToGoogleDrive:
     OUTPUT_NODE = True
 
     def save_image_to_gdrive(self, images, gdrive_upload, directory, filename_prefix,
+                             encode_workers=0, upload_workers=4, output_format="png", compress_level=4, quality=90,
                              prompt=None, extra_pnginfo=None):
         if images is None or len(images) == 0:
             return {"ui": {"images": []}}
@@ -176,38 +454,41 @@ class SaveAndUploadToGoogleDrive:
         )
 
         results = []
-
-        for batch_number, image in enumerate(images):
-            # tensor -> uint8 HWC
-            i = 255.0 * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-
-            # PNG メタデータ
-            metadata = None
-            if not getattr(args, "disable_metadata", False):
-                metadata = PngInfo()
-                if prompt is not None:
-                    metadata.add_text("prompt", json.dumps(prompt))
-                if extra_pnginfo is not None:
-                    for x in extra_pnginfo:
-                        metadata.add_text(x, json.dumps(extra_pnginfo[x]))
-
-            # ローカル保存
-            filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
-            file = f"{filename_with_batch_num}_{counter:05}.png"
-            local_path = os.path.join(full_output_folder, file)
-            img.save(local_path, pnginfo=metadata, compress_level=self.compress_level)
-
-            results.append({
-                "filename": file,
-                "subfolder": subfolder,
-                "type": self.type
-            })
-            counter += 1
-
-            # Drive アップロード
-            if gdrive_upload:
-                service = _ensure_auth(self._node_dir)
-                _upload_file(service, self.root_id, directory, local_path)
+        service = _ensure_auth(self._node_dir) if gdrive_upload else None
+
+        extension, mimetype = OUTPUT_FORMATS[output_format]
+
+        # tensor -> uint8 BHWC (バッチ全体を一度に変換)
+        pixels = images_to_uint8(images)
+
+        # メタデータ (PNG はテキストチャンク、WebP/JPEG は EXIF。バッチで一度だけシリアライズ)
+        metadata = None
+        if not getattr(args, "disable_metadata", False):
+            metadata = build_image_metadata(output_format, prompt, extra_pnginfo)
+
+        def encode(batch_number):
+            img = Image.fromarray(pixels[batch_number])
+            return encode_image(img, output_format, metadata, compress_level, quality)
+
+        # エンコードは並列、結果はバッチ順に受け取るのでファイル名とカウンタは決定的
+        workers = resolve_encode_workers(encode_workers, len(images))
+        with SinkFanout(max_workers=upload_workers) as uploads:
+            for batch_number, data in enumerate(map_ordered(encode, range(len(images)), workers)):
+                # ローカル保存
+                filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
+                file = f"{filename_with_batch_num}_{counter:05}.{extension}"
+                local_path = os.path.join(full_output_folder, file)
+                write_file(local_path, data)
+
+                results.append({
+                    "filename": file,
+                    "subfolder": subfolder,
+                    "type": self.type
+                })
+                counter += 1
+
+                # Drive アップロード (並列、次の画像のエンコードと重ねる)
+                if gdrive_upload:
+                    uploads.submit(_upload_bytes, service, self.root_id, directory, file, data, mimetype)
 
         return {"ui": {"images": results}}
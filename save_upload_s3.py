@@ -1,17 +1,62 @@
 import os
-import json
+import threading
 from datetime import datetime, timedelta
 
-import boto3
-import numpy as np
 from PIL import Image
-from PIL.PngImagePlugin import PngInfo
 from comfy.cli_args import args
 import folder_paths
 
+from .image_utils import images_to_uint8
+from .image_sinks import (
+    ENCODE_INPUTS, OUTPUT_FORMATS, build_image_metadata, encode_image, map_ordered, resolve_encode_workers,
+    upload_bytes_to_s3, write_file,
+)
+from .s3_dedup import DEDUP_MODES, content_sha256, get_dedup_index, reuse_indexed_object, upload_bytes_deduplicated
+from .s3_upload_queue import get_upload_queue, has_pending_uploads, transfer_config_from_env
+
 # AWS Settings
-session = boto3.Session(profile_name="default")
-s3 = session.client("s3", region_name="ap-northeast-1")
+AWS_PROFILE = "default"
+AWS_REGION = "ap-northeast-1"
+# e.g. a MinIO or local stand-in endpoint; unset means AWS
+S3_ENDPOINT_URL = os.getenv("CESILK_S3_ENDPOINT_URL")
+
+_s3 = None
+_s3_lock = threading.Lock()
+
+
+def get_s3_client():
+    # Created on first use, so importing the node needs neither boto3 nor a configured AWS profile
+    global _s3
+    with _s3_lock:
+        if _s3 is None:
+            import boto3
+            from botocore.config import Config
+
+            session = boto3.Session(profile_name=AWS_PROFILE)
+            if S3_ENDPOINT_URL:
+                _s3 = session.client(
+                    "s3", region_name=AWS_REGION, endpoint_url=S3_ENDPOINT_URL,
+                    config=Config(s3={"addressing_style": "path"}),
+                )
+            else:
+                _s3 = session.client("s3", region_name=AWS_REGION)
+        return _s3
+
+
+def resume_pending_uploads():
+    # Background uploads left unfinished by an earlier process (interrupted, or given up
+    # after max_attempts) are retried as soon as the package loads, not on the next
+    # background upload. boto3 is only imported when there is something to resume.
+    if not has_pending_uploads():
+        return
+
+    def resume():
+        try:
+            get_upload_queue(get_s3_client())
+        except Exception as e:
+            print(f"Could not resume pending S3 uploads: {e}")
+
+    threading.Thread(target=resume, name="cesilk-s3-resume", daemon=True).start()
 
 
 def current_jst_date() -> str:
@@ -23,7 +68,6 @@ class SaveAndUploadToS3:
         self.output_dir = folder_paths.get_output_directory()
         self.type = "output"
         self.prefix_append = ""
-        self.compress_level = 4
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -35,6 +79,12 @@ class SaveAndUploadToS3:
                 "s3_bucket": ("STRING", {"default": "sd-image-88"}),
                 "s3_path": ("STRING", {"default": ""}),
             },
+            "optional": {
+                "background_upload": ("BOOLEAN", {"default": False, "tooltip": "Return once the images are saved locally and upload them to S3 in the background. Unfinished uploads are retried when ComfyUI restarts."}),
+                **ENCODE_INPUTS,
+                "dedup": (DEDUP_MODES, {"default": "off", "tooltip": "Look up identical images in the local S3 dedup index. skip: don't upload them again. copy: create the new key with a server-side copy."}),
+                "dedup_reconcile": ("BOOLEAN", {"default": False, "tooltip": "Before uploading, drop index entries under s3_path that no longer match the bucket listing."}),
+            },
             "hidden": {
                 "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"
             },
@@ -45,25 +95,39 @@ class SaveAndUploadToS3:
     CATEGORY = "🐅cesilk_nodes"
     OUTPUT_NODE = True
 
-    def save_image_to_s3(self, images, filename_prefix, s3_upload, s3_bucket, s3_path, prompt=None, extra_pnginfo=None):
+    def save_image_to_s3(self, images, filename_prefix, s3_upload, s3_bucket, s3_path, background_upload=False,
+                         encode_workers=0, output_format="png", compress_level=4, quality=90, dedup="off",
+                         dedup_reconcile=False, prompt=None, extra_pnginfo=None):
         filename_prefix += self.prefix_append
         full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
         results = list()
-        for (batch_number, image) in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            metadata = None
-            if not args.disable_metadata:
-                metadata = PngInfo()
-                if prompt is not None:
-                    metadata.add_text("prompt", json.dumps(prompt))
-                if extra_pnginfo is not None:
-                    for x in extra_pnginfo:
-                        metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+        transfer_config = transfer_config_from_env()
+
+        index = None
+        if s3_upload:
+            if not s3_path:
+                s3_path = f"outputs/{current_jst_date()}/"
+            if dedup != "off":
+                index = get_dedup_index()
+                if dedup_reconcile:
+                    index.reconcile(get_s3_client(), s3_bucket, s3_path)
 
+        extension, content_type = OUTPUT_FORMATS[output_format]
+        pixels = images_to_uint8(images)
+        metadata = None
+        if not args.disable_metadata:
+            metadata = build_image_metadata(output_format, prompt, extra_pnginfo)
+
+        def encode(batch_number):
+            img = Image.fromarray(pixels[batch_number])
+            return encode_image(img, output_format, metadata, compress_level, quality)
+
+        # Encoding runs in parallel, but results arrive in batch order so names and counters stay deterministic
+        workers = resolve_encode_workers(encode_workers, len(images))
+        for batch_number, data in enumerate(map_ordered(encode, range(len(images)), workers)):
             filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
-            file = f"{filename_with_batch_num}_{counter:05}_.png"
-            img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
+            file = f"{filename_with_batch_num}_{counter:05}_.{extension}"
+            write_file(os.path.join(full_output_folder, file), data)
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -72,10 +136,23 @@ class SaveAndUploadToS3:
             counter += 1
 
             if s3_upload:
-                if not s3_path:
-                    s3_path = f"outputs/{current_jst_date()}/"
                 key = os.path.join(s3_path, file)
-                s3.upload_file(os.path.join(full_output_folder, file), s3_bucket, key)
-                print(f"upload image success. S3 Key: {key}")
+                if background_upload:
+                    self.queue_upload(os.path.join(full_output_folder, file), data, s3_bucket, key, content_type, index, dedup)
+                elif index is not None:
+                    upload_bytes_deduplicated(get_s3_client(), index, dedup, data, s3_bucket, key, transfer_config, content_type)
+                else:
+                    # upload the encoded buffer instead of reading the file back from disk
+                    upload_bytes_to_s3(get_s3_client(), data, s3_bucket, key, transfer_config, content_type)
 
         return { "ui": { "images": results } }
+
+    def queue_upload(self, path, data, bucket, key, content_type, index, dedup):
+        sha256 = None
+        if index is not None:
+            sha256 = content_sha256(data)
+            # a skip or server-side copy is at most one small request, so it is not worth queueing
+            if reuse_indexed_object(get_s3_client(), index, dedup, sha256, bucket, key, len(data)):
+                return
+        get_upload_queue(get_s3_client()).submit(path, bucket, key, sha256, content_type)
+        print(f"queued image for upload. S3 Key: {key}")
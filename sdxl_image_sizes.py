@@ -1,3 +1,10 @@
+import bisect
+import math
+
+import torch
+import torch.nn.functional as F
+
+
 class SdxlImageSizes:
     SDXL_SIZES = {
         "1024x1024 (1:1)": (1024, 1024),
@@ -32,5 +39,133 @@ class SdxlImageSizes:
     CATEGORY = "🐅cesilk_nodes"
 
     def get_dimensions(self, size):
-        w_str, h_str = size.split(" ")[0].split("x")
-        return int(w_str), int(h_str)
\ No newline at end of file
+        return self.SDXL_SIZES[size]
+
+
+# Buckets sorted by log aspect ratio (log(w / h)), parsed once at import
+SDXL_BUCKETS = sorted(set(SdxlImageSizes.SDXL_SIZES.values()), key=lambda size: (math.log(size[0] / size[1]), size))
+SDXL_BUCKET_LOG_ASPECTS = [math.log(w / h) for w, h in SDXL_BUCKETS]
+
+
+def nearest_sdxl_bucket(width, height):
+    """
+    Returns the SDXL (width, height) whose aspect ratio is closest to the
+    given size in log space. If several buckets share that aspect ratio, the
+    one with the pixel count closest to the source wins.
+    """
+    target = math.log(width / height)
+    i = bisect.bisect_left(SDXL_BUCKET_LOG_ASPECTS, target)
+    best = min(
+        (j for j in (i - 1, i) if 0 <= j < len(SDXL_BUCKETS)),
+        key=lambda j: abs(SDXL_BUCKET_LOG_ASPECTS[j] - target),
+    )
+    aspect = SDXL_BUCKET_LOG_ASPECTS[best]
+    ties = SDXL_BUCKETS[
+        bisect.bisect_left(SDXL_BUCKET_LOG_ASPECTS, aspect):bisect.bisect_right(SDXL_BUCKET_LOG_ASPECTS, aspect)
+    ]
+    return min(ties, key=lambda size: abs(math.log(size[0] * size[1] / (width * height))))
+
+
+def resize_to_bucket(images, bucket, upscale_method="bicubic", crop="center"):
+    """
+    Resizes an IMAGE batch ([B, H, W, C]) to ``bucket`` with one interpolate
+    call. With crop "center" the batch is first cropped to the bucket's aspect
+    ratio (a view, no copy), so only the kept pixels are resampled.
+    """
+    _, h, w, _ = images.shape
+    bucket_w, bucket_h = bucket
+    if crop == "center":
+        if w * bucket_h > h * bucket_w:
+            crop_w = max(1, round(h * bucket_w / bucket_h))
+            x = (w - crop_w) // 2
+            images = images[:, :, x:x + crop_w]
+        else:
+            crop_h = max(1, round(w * bucket_h / bucket_w))
+            y = (h - crop_h) // 2
+            images = images[:, y:y + crop_h]
+
+    samples = images.movedim(-1, 1)
+    if upscale_method in ("bilinear", "bicubic"):
+        samples = F.interpolate(samples, size=(bucket_h, bucket_w), mode=upscale_method, antialias=True)
+    else:
+        samples = F.interpolate(samples, size=(bucket_h, bucket_w), mode=upscale_method)
+    if upscale_method == "bicubic":
+        # bicubic overshoots at hard edges
+        samples = samples.clamp(0, 1)
+    return samples.movedim(1, -1)
+
+
+class SdxlBucketResize:
+    """
+    Resizes each input to its nearest SDXL bucket.
+
+    Accepts a list of IMAGE batches of any sizes (e.g. from a directory
+    loader). Inputs of the same source size are concatenated and resized
+    together, up to ``chunk_size`` images per interpolate call.
+    """
+
+    upscale_methods = ["bicubic", "bilinear", "area", "nearest-exact"]
+    crop_methods = ["center", "disabled"]
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "images": ("IMAGE",),
+                "upscale_method": (cls.upscale_methods,),
+                "crop": (cls.crop_methods, {"tooltip": "center crops to the bucket's aspect ratio, disabled stretches."}),
+            },
+            "optional": {
+                "chunk_size": (
+                    "INT",
+                    {
+                        "default": 64,
+                        "min": 1,
+                        "max": 4096,
+                        "step": 1,
+                        "tooltip": "Maximum number of images resized in one batched call. Bounds peak memory."
+                    }
+                ),
+            }
+        }
+
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("IMAGE", "INT", "INT")
+    RETURN_NAMES = ("images", "width", "height")
+    OUTPUT_IS_LIST = (True, True, True)
+    FUNCTION = "resize"
+    CATEGORY = "🐅cesilk_nodes"
+
+    def resize(self, images, upscale_method, crop, chunk_size=None):
+        upscale_method = upscale_method[0]
+        crop = crop[0]
+        chunk_size = chunk_size[0] if chunk_size else 64
+
+        # source size -> indices of the inputs with that size
+        groups = {}
+        for i, batch in enumerate(images):
+            groups.setdefault(tuple(batch.shape[1:3]), []).append(i)
+
+        results = [None] * len(images)
+        buckets = [None] * len(images)
+        for (h, w), indices in groups.items():
+            bucket = nearest_sdxl_bucket(w, h)
+            for chunk in self._chunks(images, indices, chunk_size):
+                resized = resize_to_bucket(torch.cat([images[i] for i in chunk]), bucket, upscale_method, crop)
+                for i, part in zip(chunk, resized.split([images[i].shape[0] for i in chunk])):
+                    results[i] = part
+                    buckets[i] = bucket
+
+        return (results, [w for w, _ in buckets], [h for _, h in buckets])
+
+    def _chunks(self, images, indices, chunk_size):
+        # keeps whole input batches together; a chunk may exceed chunk_size only for one oversized batch
+        chunk, count = [], 0
+        for i in indices:
+            if chunk and count + images[i].shape[0] > chunk_size:
+                yield chunk
+                chunk, count = [], 0
+            chunk.append(i)
+            count += images[i].shape[0]
+        if chunk:
+            yield chunk